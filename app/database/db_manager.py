@@ -1,15 +1,37 @@
-from sqlalchemy import create_engine, text
-from google.cloud.sql.connector import Connector
-from app.settings.config import INSTANCE_DB, USER_DB, PASSWORD_DB, NAME_DB,  MELI_SCHMA
+from sqlalchemy import create_engine, text, bindparam
+from app.settings.config import (
+    INSTANCE_DB, USER_DB, PASSWORD_DB, NAME_DB,  MELI_SCHMA, DB_LOAD_CHUNK, DB_COMMIT_PER_CHUNK,
+    DB_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW,
+)
 from app.utils.logger import logger
+from app.services import metrics
+from app.services.canonical import expand
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import time, threading, atexit
 
 ##!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 ##CAMBIAR ESQUEMAS FIJOS A PARAMETROS 
 ##!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 
+# ──────────────────────────────────────────────────────────────────────────────
+# CONNECTION: one Cloud SQL connector per process, engine built on first use
+# ──────────────────────────────────────────────────────────────────────────────
+_connector = None
+_engine = None
+_lock = threading.Lock()
+
+def get_connector():
+    """Process-wide Cloud SQL connector (certs are refreshed once, not per connection)."""
+    global _connector
+    with _lock:
+        if _connector is None:
+            from google.cloud.sql.connector import Connector
+            _connector = Connector()
+        return _connector
+
 def getconn():
-    connector = Connector() 
-    return connector.connect(
+    return get_connector().connect(
         INSTANCE_DB,
         "pymysql",
         user=USER_DB,
@@ -17,20 +39,59 @@ def getconn():
         db=NAME_DB,
     )   
 
-engine = create_engine(
-        "mysql+pymysql://",
-        creator=getconn,
-        pool_pre_ping=True,
-        pool_size=5,
-        max_overflow=2,
-    )
+def get_engine():
+    """
+    SQLAlchemy engine, created lazily. DB_URL (e.g. sqlite:///local.db or a
+    local mysql+pymysql URL) bypasses the Cloud SQL connector.
+    """
+    global _engine
+    with _lock:
+        if _engine is None:
+            if DB_URL:
+                _engine = create_engine(DB_URL, pool_pre_ping=True)
+            else:
+                _engine = create_engine(
+                    "mysql+pymysql://",
+                    creator=getconn,
+                    pool_pre_ping=True,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                )
+        return _engine
+
+def warm_pool(size=None):
+    """Open `size` pooled connections up front so the run does not pay for them later."""
+    engine = get_engine()
+    size = min(size or DB_POOL_SIZE, DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    started = time.perf_counter()
+
+    def ping(_):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    # Open them concurrently so they are all checked out (and kept) at once
+    with ThreadPoolExecutor(max_workers=size) as pool:
+        list(pool.map(ping, range(size)))
+    logger.info(f"DB pool warmed: {size} connections in {time.perf_counter() - started:.2f}s")
+
+@atexit.register
+def shutdown():
+    """Dispose the pool and close the connector (also runs at interpreter exit)."""
+    global _engine, _connector
+    with _lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+        if _connector is not None:
+            _connector.close()
+            _connector = None
 
 def get_urls():
-    with engine.begin() as conn:
+    with get_engine().begin() as conn:
         logger.info("Extracting Catalog urls.")
         result = conn.execute(
             text(f"""
-                SELECT distinct catalog_link FROM {NAME_DB}.scrapped_competence
+                SELECT distinct catalog_link FROM {qualified("scrapped_competence")}
                 WHERE catalog_link is not null;
             """)
         )
@@ -43,34 +104,526 @@ def get_urls():
         
 
 
-def load_scrap(result_list):
+# ──────────────────────────────────────────────────────────────────────────────
+# BULK LOAD (staging table + set-based UPDATE)
+# ──────────────────────────────────────────────────────────────────────────────
+SCRAP_COLUMNS = [
+    "catalog_link", "title", "price", "competitor", "price_in_installments",
+    "image", "timestamp", "status", "api_cost_total",
+]
+STAGING_TABLE = "scrap_staging"
+
+STAGING_DDL = {
+    "mysql": f"""
+        CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} (
+            catalog_link VARCHAR(768) NOT NULL,
+            title TEXT, price BIGINT, competitor VARCHAR(255), price_in_installments VARCHAR(255),
+            image TEXT, timestamp VARCHAR(32), status VARCHAR(32), api_cost_total DOUBLE,
+            INDEX (catalog_link)
+        )
+    """,
+    "sqlite": f"""
+        CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+            catalog_link TEXT NOT NULL,
+            title TEXT, price INTEGER, competitor TEXT, price_in_installments TEXT,
+            image TEXT, timestamp TEXT, status TEXT, api_cost_total REAL
+        )
+    """,
+}
+
+def qualified(table):
+    """Schema-qualified table name (plain name when no schema is configured, e.g. SQLite)."""
+    return f"{MELI_SCHMA}.{table}" if MELI_SCHMA else table
+
+def upsert_query(dialect, table_name, columns, key):
+    """
+    INSERT that updates every non-key column when `key` already exists (MySQL / SQLite).
+    `key` is a column name or a tuple of columns for composite keys.
+    """
+    keys = (key,) if isinstance(key, str) else tuple(key)
+    insert = f"""
+        INSERT INTO {table_name} ({", ".join(columns)})
+        VALUES ({", ".join(f":{c}" for c in columns)})
+    """
+    updates = [c for c in columns if c not in keys]
+    if dialect == "mysql":
+        return text(insert + "ON DUPLICATE KEY UPDATE " + ", ".join(f"{c} = VALUES({c})" for c in updates))
+    return text(insert + f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET " + ", ".join(f"{c} = excluded.{c}" for c in updates))
+
+_ensured = set()
+
+def ensure_table(conn, table, ddl):
+    """
+    Create one of our auxiliary tables (once per process). `ddl` maps dialect ->
+    CREATE statement, or a tuple of statements (e.g. CREATE TABLE + CREATE INDEX).
+    """
+    if table in _ensured:
+        return
+    statements = ddl[conn.dialect.name]
+    for statement in (statements,) if isinstance(statements, str) else statements:
+        conn.execute(text(statement.format(table=qualified(table), name=table)))
+    _ensured.add(table)
+
+def _update_from_staging(dialect, table_name):
+    """One set-based UPDATE of the target table from the staging rows."""
+    columns = [c for c in SCRAP_COLUMNS if c != "catalog_link"]
+    if dialect == "mysql":
+        assignments = ", ".join(f"t.{c} = s.{c}" for c in columns)
+        return text(f"""
+            UPDATE {table_name} t
+            JOIN {STAGING_TABLE} s ON t.catalog_link = s.catalog_link
+            SET {assignments}
+        """)
+    assignments = ", ".join(f"{c} = s.{c}" for c in columns)
+    return text(f"""
+        UPDATE {table_name} SET {assignments}
+        FROM {STAGING_TABLE} s
+        WHERE {table_name}.catalog_link = s.catalog_link
+    """)
+
+def load_scrap(result_list, engine=None, chunk_size=DB_LOAD_CHUNK, commit_per_chunk=DB_COMMIT_PER_CHUNK, aliases=None,
+               index=None):
     """
     Actualiza registros existentes en la tabla basándose en catalog_link.
+    Cada chunk se inserta en una tabla staging temporal (INSERT multi-fila) y se
+    aplica con un único UPDATE ... JOIN; con commit_per_chunk los locks se
+    liberan al final de cada chunk en lugar de al final de la carga.
+    `aliases` ({link canónico: [links originales]}, ver canonical.group_links)
+    replica cada resultado en todas las filas originales del mismo producto.
+    Con `index` (StateIndex) solo se escriben las filas que cambiaron y los
+    cambios de precio/competidor se agregan a scrape_price_history.
     """
-    table_name = f"{MELI_SCHMA}.scrapped_competence"
+    engine = engine or get_engine()
+    table_name = qualified("scrapped_competence")
 
     if not result_list:
         logger.info("No hay datos para procesar.")
         return
+    if aliases:
+        result_list = list(expand(result_list, aliases))
+
+    # Last row wins if a link appears twice
+    rows = list({r["catalog_link"]: {c: r.get(c) for c in SCRAP_COLUMNS} for r in result_list}.values())
+    if index is not None:
+        scraped = rows
+        rows, history = index.diff(scraped)
+        metrics.DB_UNCHANGED.inc(len(scraped) - len(rows))
+        logger.info(f"Sin cambios: {len(scraped) - len(rows)} de {len(scraped)} filas (no se escriben).")
+        if not rows:
+            index.update(scraped)
+            return
+    dialect = engine.dialect.name
+    insert_query = text(f"""
+        INSERT INTO {STAGING_TABLE} ({", ".join(SCRAP_COLUMNS)})
+        VALUES ({", ".join(f":{c}" for c in SCRAP_COLUMNS)})
+    """)
+    update_query = _update_from_staging(dialect, table_name)
+
+    logger.info(f"Actualizando {len(rows)} registros en {table_name} (chunks de {chunk_size})...")
+    affected = 0
+    with engine.connect() as conn:
+        conn.execute(text(STAGING_DDL[dialect]))
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            started = time.perf_counter()
+            conn.execute(text(f"DELETE FROM {STAGING_TABLE}"))
+            conn.execute(insert_query, chunk)
+            affected += conn.execute(update_query).rowcount
+            if commit_per_chunk:
+                conn.commit()
+            elapsed = time.perf_counter() - started
+            metrics.DB_LOAD_SECONDS.observe(elapsed)
+            for row in chunk:
+                metrics.DB_ROWS.inc(status=row["status"])
+            logger.info(f"Chunk {start // chunk_size + 1}: {len(chunk)} filas en {elapsed:.2f}s")
+        conn.execute(text(f"DROP {'TEMPORARY ' if dialect == 'mysql' else ''}TABLE IF EXISTS {STAGING_TABLE}"))
+        conn.commit()
+    if index is not None:
+        # solo con las filas ya escritas: si un chunk falla, el índice y el historial no las registran
+        save_price_history(history, engine)
+        index.update(scraped)
+    logger.info(f"Proceso completado. Filas afectadas: {affected}")
+
+# ──────────────────────────────────────────────────────────────────────────────
+# LINK STATE (used by the planner)
+# ──────────────────────────────────────────────────────────────────────────────
+PLAN_STATE_TABLE = "scrape_plan_state"
+PLAN_STATE_DDL = {
+    "mysql": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            catalog_link VARCHAR(768) NOT NULL PRIMARY KEY,
+            discard_streak INT NOT NULL DEFAULT 0,
+            last_status VARCHAR(32),
+            updated_at VARCHAR(32),
+            last_success VARCHAR(32)
+        )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            catalog_link TEXT NOT NULL PRIMARY KEY,
+            discard_streak INTEGER NOT NULL DEFAULT 0,
+            last_status TEXT,
+            updated_at TEXT,
+            last_success TEXT
+        )
+    """,
+}
+
+def get_link_states(engine=None):
+    """
+    One dict per catalog_link with what the planner needs: last scrape
+    timestamp, status, last successful scrape, credits spent and consecutive
+    'discarded' runs.
+    Change-only loads leave scrapped_competence.timestamp at the last change,
+    so the newer of it and the plan state's updated_at (last check) wins.
+    """
+    engine = engine or get_engine()
+    newer = "p.updated_at IS NULL OR p.updated_at < c.timestamp"
+    succeeded = "c.status IN ('successed', 'discarded') AND (p.last_success IS NULL OR p.last_success < c.timestamp)"
+    with engine.begin() as conn:
+        ensure_table(conn, PLAN_STATE_TABLE, PLAN_STATE_DDL)
+        result = conn.execute(text(f"""
+            SELECT c.catalog_link,
+                   MAX(CASE WHEN {newer} THEN c.timestamp ELSE p.updated_at END) AS timestamp,
+                   MAX(CASE WHEN {newer} THEN c.status ELSE p.last_status END) AS status,
+                   MAX(CASE WHEN {succeeded} THEN c.timestamp ELSE p.last_success END) AS last_success,
+                   MAX(c.api_cost_total) AS api_cost_total, MAX(p.discard_streak) AS discard_streak
+            FROM {qualified("scrapped_competence")} c
+            LEFT JOIN {qualified(PLAN_STATE_TABLE)} p ON p.catalog_link = c.catalog_link
+            WHERE c.catalog_link IS NOT NULL
+            GROUP BY c.catalog_link
+        """))
+        states = [dict(row) for row in result.mappings()]
+    logger.info(f"Link states loaded: {len(states)}")
+    return states
+
+def save_link_states(rows, engine=None):
+    """Upsert planner state rows (catalog_link, discard_streak, last_status, updated_at, last_success)."""
+    if not rows:
+        return
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        ensure_table(conn, PLAN_STATE_TABLE, PLAN_STATE_DDL)
+        columns = ["catalog_link", "discard_streak", "last_status", "updated_at", "last_success"]
+        conn.execute(upsert_query(engine.dialect.name, qualified(PLAN_STATE_TABLE), columns, "catalog_link"), rows)
 
+# ──────────────────────────────────────────────────────────────────────────────
+# PROFILE MEMORY (which ScrapeConfig profile works for each link)
+# ──────────────────────────────────────────────────────────────────────────────
+PROFILE_TABLE = "scrape_profile_memory"
+PROFILE_DDL = {
+    "mysql": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            catalog_link VARCHAR(768) NOT NULL PRIMARY KEY,
+            profile VARCHAR(32) NOT NULL,
+            fail_streak INT NOT NULL DEFAULT 0,
+            ok_streak INT NOT NULL DEFAULT 0,
+            api_cost DOUBLE,
+            updated_at VARCHAR(32)
+        )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            catalog_link TEXT NOT NULL PRIMARY KEY,
+            profile TEXT NOT NULL,
+            fail_streak INTEGER NOT NULL DEFAULT 0,
+            ok_streak INTEGER NOT NULL DEFAULT 0,
+            api_cost REAL,
+            updated_at TEXT
+        )
+    """,
+}
+PROFILE_COLUMNS = ["catalog_link", "profile", "fail_streak", "ok_streak", "api_cost", "updated_at"]
+
+def get_profile_memory(engine=None):
+    """{catalog_link: memory row} for every link with a learned profile."""
+    engine = engine or get_engine()
     with engine.begin() as conn:
-        # Ya no hacemos TRUNCATE, porque queremos conservar los datos para actualizarlos
-        logger.info(f"Actualizando {len(result_list)} registros en {table_name}...")
-
-        # Usamos la sintaxis de UPDATE filtrando por catalog_link
-        update_query = text(f"""
-            UPDATE {table_name} 
-            SET 
-                title = :title, 
-                price = :price, 
-                competitor = :competitor, 
-                price_in_installments = :price_in_installments, 
-                image = :image, 
-                timestamp = :timestamp, 
-                status = :status, 
-                api_cost_total = :api_cost_total
-            WHERE catalog_link = :catalog_link
-        """)
+        ensure_table(conn, PROFILE_TABLE, PROFILE_DDL)
+        result = conn.execute(text(f"SELECT {', '.join(PROFILE_COLUMNS)} FROM {qualified(PROFILE_TABLE)}"))
+        return {row["catalog_link"]: dict(row) for row in result.mappings()}
 
-        result = conn.execute(update_query, result_list)
-        logger.info(f"Proceso completado. Filas afectadas: {result.rowcount}")
+def save_profile_memory(rows, engine=None):
+    if not rows:
+        return
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        ensure_table(conn, PROFILE_TABLE, PROFILE_DDL)
+        conn.execute(upsert_query(engine.dialect.name, qualified(PROFILE_TABLE), PROFILE_COLUMNS, "catalog_link"), rows)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# SHARD STATUS (multi-instance runs)
+# ──────────────────────────────────────────────────────────────────────────────
+SHARD_TABLE = "scrape_shard_status"
+SHARD_DDL = {
+    "mysql": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            run_id VARCHAR(64) NOT NULL,
+            shard_index INT NOT NULL,
+            shard_count INT NOT NULL,
+            status VARCHAR(16) NOT NULL,
+            urls INT,
+            execution VARCHAR(128),
+            updated_at VARCHAR(32),
+            PRIMARY KEY (run_id, shard_index)
+        )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            run_id TEXT NOT NULL,
+            shard_index INTEGER NOT NULL,
+            shard_count INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            urls INTEGER,
+            execution TEXT,
+            updated_at TEXT,
+            PRIMARY KEY (run_id, shard_index)
+        )
+    """,
+}
+SHARD_COLUMNS = ["run_id", "shard_index", "shard_count", "status", "urls", "execution", "updated_at"]
+
+def save_shard_status(row, engine=None):
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        ensure_table(conn, SHARD_TABLE, SHARD_DDL)
+        conn.execute(upsert_query(engine.dialect.name, qualified(SHARD_TABLE), SHARD_COLUMNS, ("run_id", "shard_index")), row)
+
+def get_shard_statuses(run_id, engine=None):
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        ensure_table(conn, SHARD_TABLE, SHARD_DDL)
+        result = conn.execute(
+            text(f"SELECT {', '.join(SHARD_COLUMNS)} FROM {qualified(SHARD_TABLE)} WHERE run_id = :run_id"),
+            {"run_id": run_id},
+        )
+        return [dict(row) for row in result.mappings()]
+
+# One row per run (and job execution): which shard sends the closing notification
+SHARD_RUN_TABLE = "scrape_shard_run"
+SHARD_RUN_DDL = {
+    "mysql": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            run_id VARCHAR(64) NOT NULL,
+            execution VARCHAR(128) NOT NULL DEFAULT '',
+            notified_by INT,
+            notified_at VARCHAR(32),
+            PRIMARY KEY (run_id, execution)
+        )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            run_id TEXT NOT NULL,
+            execution TEXT NOT NULL DEFAULT '',
+            notified_by INTEGER,
+            notified_at TEXT,
+            PRIMARY KEY (run_id, execution)
+        )
+    """,
+}
+
+def claim_shard_notification(run_id, execution, shard_index, notified_at, engine=None):
+    """
+    True for exactly one caller per (run_id, execution): the run row is created
+    if missing and a conditional UPDATE takes it, so two shards finishing at
+    the same time cannot both send the closing message.
+    """
+    engine = engine or get_engine()
+    table_name = qualified(SHARD_RUN_TABLE)
+    insert = "INSERT IGNORE" if engine.dialect.name == "mysql" else "INSERT OR IGNORE"
+    params = {"run_id": run_id, "execution": execution or "", "shard_index": shard_index, "notified_at": notified_at}
+    with engine.begin() as conn:
+        ensure_table(conn, SHARD_RUN_TABLE, SHARD_RUN_DDL)
+        conn.execute(text(f"{insert} INTO {table_name} (run_id, execution) VALUES (:run_id, :execution)"), params)
+        claimed = conn.execute(text(f"""
+            UPDATE {table_name} SET notified_by = :shard_index, notified_at = :notified_at
+            WHERE run_id = :run_id AND execution = :execution AND notified_by IS NULL
+        """), params).rowcount
+    return claimed == 1
+
+# ──────────────────────────────────────────────────────────────────────────────
+# SELLER OFFERS (every seller listed on a catalog page)
+# ──────────────────────────────────────────────────────────────────────────────
+OFFERS_TABLE = "scrape_offers"
+OFFERS_DDL = {
+    "mysql": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            catalog_link VARCHAR(768) NOT NULL,
+            position INT NOT NULL,
+            seller VARCHAR(255) NOT NULL,
+            item_id VARCHAR(32),
+            price BIGINT,
+            timestamp VARCHAR(32),
+            PRIMARY KEY (catalog_link, position),
+            INDEX (seller)
+        )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            catalog_link TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            seller TEXT NOT NULL,
+            item_id TEXT,
+            price INTEGER,
+            timestamp TEXT,
+            PRIMARY KEY (catalog_link, position)
+        )
+    """,
+}
+OFFERS_COLUMNS = ["catalog_link", "position", "seller", "item_id", "price", "timestamp"]
+
+def load_offers(result_list, engine=None, chunk_size=DB_LOAD_CHUNK, aliases=None):
+    """
+    Reemplaza las ofertas de cada catalog_link con las del último scrape.
+    Solo se tocan los links cuyo row trae "offers" no vacío (un scrape fallido
+    no borra las ofertas conocidas). `aliases` como en load_scrap.
+    """
+    rows = [r for r in result_list if r.get("offers")]
+    if aliases:
+        rows = list(expand(rows, aliases))
+    if not rows:
+        return
+    engine = engine or get_engine()
+    table_name = qualified(OFFERS_TABLE)
+    rows = list({r["catalog_link"]: r for r in rows}.values())
+    delete_query = text(f"DELETE FROM {table_name} WHERE catalog_link IN :links").bindparams(
+        bindparam("links", expanding=True)
+    )
+    insert_query = text(f"""
+        INSERT INTO {table_name} ({", ".join(OFFERS_COLUMNS)})
+        VALUES ({", ".join(f":{c}" for c in OFFERS_COLUMNS)})
+    """)
+
+    started, total = time.perf_counter(), 0
+    with engine.begin() as conn:
+        ensure_table(conn, OFFERS_TABLE, OFFERS_DDL)
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            offers = [
+                {"catalog_link": r["catalog_link"], "timestamp": r.get("timestamp"), **{c: o.get(c) for c in OFFERS_COLUMNS[1:5]}}
+                for r in chunk for o in r["offers"]
+            ]
+            conn.execute(delete_query, {"links": [r["catalog_link"] for r in chunk]})
+            conn.execute(insert_query, offers)
+            total += len(offers)
+    logger.info(f"Ofertas: {total} filas para {len(rows)} links en {time.perf_counter() - started:.2f}s")
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CHANGE-ONLY WRITES (last known state per link) + PRICE HISTORY
+# ──────────────────────────────────────────────────────────────────────────────
+# Columns compared against the last known state; timestamp and api_cost_total
+# change on every scrape and do not make a row worth rewriting.
+STATE_COLUMNS = ["title", "price", "competitor", "price_in_installments", "image", "status"]
+HISTORY_TABLE = "scrape_price_history"
+HISTORY_DDL = {
+    "mysql": ("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            catalog_link VARCHAR(768) NOT NULL,
+            timestamp VARCHAR(32) NOT NULL,
+            price BIGINT,
+            competitor VARCHAR(255),
+            PRIMARY KEY (catalog_link, timestamp),
+            INDEX (timestamp)
+        )
+    """,),
+    "sqlite": ("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            catalog_link TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            price INTEGER,
+            competitor TEXT,
+            PRIMARY KEY (catalog_link, timestamp)
+        )
+    """, "CREATE INDEX IF NOT EXISTS ix_{name}_timestamp ON {table} (timestamp)"),
+}
+HISTORY_COLUMNS = ["catalog_link", "timestamp", "price", "competitor"]
+
+def _norm(value):
+    # MySQL VARCHARs come back as str where the scraped row has ints ("0" vs 0)
+    return None if value is None else str(value)
+
+class StateIndex:
+    """
+    Estado conocido de cada catalog_link, cargado de una vez al inicio de la
+    corrida: lo que hay en scrapped_competence y el último (precio, competidor)
+    de scrape_price_history. load_scrap lo usa para escribir solo lo que cambió.
+    """
+
+    def __init__(self, states=None, prices=None):
+        self.states = states or {}  # {link: tuple of STATE_COLUMNS}
+        self.prices = prices or {}  # {link: (price, competitor)} last successful observation
+
+    @classmethod
+    def load(cls, engine=None):
+        engine = engine or get_engine()
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            ensure_table(conn, HISTORY_TABLE, HISTORY_DDL)
+            result = conn.execute(text(f"""
+                SELECT catalog_link, {", ".join(STATE_COLUMNS)} FROM {qualified("scrapped_competence")}
+                WHERE catalog_link IS NOT NULL
+            """))
+            states = {row[0]: tuple(_norm(v) for v in row[1:]) for row in result}
+            result = conn.execute(text(f"""
+                SELECT h.catalog_link, h.price, h.competitor
+                FROM {qualified(HISTORY_TABLE)} h
+                JOIN (
+                    SELECT catalog_link, MAX(timestamp) AS timestamp FROM {qualified(HISTORY_TABLE)} GROUP BY catalog_link
+                ) last ON last.catalog_link = h.catalog_link AND last.timestamp = h.timestamp
+            """))
+            prices = {row[0]: (_norm(row[1]), _norm(row[2])) for row in result}
+        # links scraped before the history table existed start from their current row
+        price_at, competitor_at, status_at = (STATE_COLUMNS.index(c) for c in ("price", "competitor", "status"))
+        for link, state in states.items():
+            if link not in prices and state[status_at] == "successed":
+                prices[link] = (state[price_at], state[competitor_at])
+        logger.info(f"State index loaded: {len(states)} links, {len(prices)} prices in {time.perf_counter() - started:.2f}s")
+        return cls(states, prices)
+
+    def diff(self, rows):
+        """
+        (rows whose STATE_COLUMNS differ from the last known state,
+         history rows for successful scrapes whose price or competitor changed).
+        """
+        changed, history = [], []
+        for row in rows:
+            link = row["catalog_link"]
+            if self.states.get(link) != tuple(_norm(row.get(c)) for c in STATE_COLUMNS):
+                changed.append(row)
+            price = (_norm(row.get("price")), _norm(row.get("competitor")))
+            if row.get("status") == "successed" and row.get("price") and self.prices.get(link) != price:
+                history.append({c: row.get(c) for c in HISTORY_COLUMNS})
+        return changed, history
+
+    def update(self, rows):
+        """Record `rows` as the new known state (call once they are written)."""
+        for row in rows:
+            self.states[row["catalog_link"]] = tuple(_norm(row.get(c)) for c in STATE_COLUMNS)
+            if row.get("status") == "successed" and row.get("price"):
+                self.prices[row["catalog_link"]] = (_norm(row.get("price")), _norm(row.get("competitor")))
+
+def save_price_history(rows, engine=None):
+    """Append price/competitor changes (idempotent on (catalog_link, timestamp))."""
+    if not rows:
+        return
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        ensure_table(conn, HISTORY_TABLE, HISTORY_DDL)
+        conn.execute(
+            upsert_query(engine.dialect.name, qualified(HISTORY_TABLE), HISTORY_COLUMNS, ("catalog_link", "timestamp")),
+            rows,
+        )
+    metrics.PRICE_CHANGES.inc(len(rows))
+    logger.info(f"Price history: {len(rows)} changes appended.")
+
+def get_price_volatility(days, engine=None):
+    """{catalog_link: price/competitor changes per day} over the last `days` of scrape_price_history."""
+    engine = engine or get_engine()
+    since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%S")
+    with engine.begin() as conn:
+        ensure_table(conn, HISTORY_TABLE, HISTORY_DDL)
+        result = conn.execute(text(f"""
+            SELECT catalog_link, COUNT(*) FROM {qualified(HISTORY_TABLE)}
+            WHERE timestamp >= :since GROUP BY catalog_link
+        """), {"since": since})
+        return {link: changes / days for link, changes in result}
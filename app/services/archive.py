@@ -0,0 +1,253 @@
+from app.settings.config import (
+    ARCHIVE_ENABLED, ARCHIVE_DIR, ARCHIVE_LEVEL, ARCHIVE_MAX_RUNS, ARCHIVE_MAX_MB, EXTRACT_OFFERS,
+)
+from app.services.checkpoint import Checkpoint
+from app.services.extractor import extract_fields, extract_offers, DISCARD_PHRASE
+from app.services.json_merge import ScrapReducer
+from app.database.db_manager import load_scrap, load_offers, get_link_states, save_link_states
+from app.services.canonical import group_links, expand
+from app.services.planner import next_states, parse_ts
+from app.utils.logger import logger
+from functools import partial
+import argparse, asyncio, hashlib, os, time, zlib
+
+try:
+    import zstandard
+except ImportError:  # optional: fall back to zlib, blobs stay readable either way
+    zstandard = None
+
+# ──────────────────────────────────────────────────────────────────────────────
+# LAYOUT
+#   <ARCHIVE_DIR>/blobs/<sha[:2]>/<sha256 of the HTML>.zst|.zz   one file per distinct page
+#   <ARCHIVE_DIR>/runs/<run_id>-pages.jsonl                      {url, timestamp, profile, cost, sha}
+# Identical pages (same HTML) share a blob across URLs and runs.
+# ──────────────────────────────────────────────────────────────────────────────
+CODECS = (".zst", ".zz")
+
+def _blobs_dir(directory):
+    return os.path.join(directory, "blobs")
+
+def _runs_dir(directory):
+    return os.path.join(directory, "runs")
+
+def _blob_path(directory, digest, ext):
+    return os.path.join(_blobs_dir(directory), digest[:2], digest + ext)
+
+def _compress(data, level):
+    if zstandard is not None:
+        return ".zst", zstandard.ZstdCompressor(level=level).compress(data)
+    return ".zz", zlib.compress(data, min(level, 9))
+
+def _decompress(data, ext):
+    if ext == ".zst":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read .zst archive blobs")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# BLOBS (module functions: they run on the parse pool, must stay picklable)
+# ──────────────────────────────────────────────────────────────────────────────
+def store_blob(directory, html, level=ARCHIVE_LEVEL):
+    """Compress and store `html` under its SHA-256 (no-op if already stored). Returns the digest."""
+    data = html.encode("utf-8") if isinstance(html, str) else html
+    digest = hashlib.sha256(data).hexdigest()
+    if any(os.path.exists(_blob_path(directory, digest, ext)) for ext in CODECS):
+        return digest
+    ext, payload = _compress(data, level)
+    path = _blob_path(directory, digest, ext)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(payload)
+    os.replace(tmp, path)  # atomic: concurrent writers of the same page are harmless
+    return digest
+
+def load_blob(directory, digest):
+    for ext in CODECS:
+        path = _blob_path(directory, digest, ext)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return _decompress(f.read(), ext).decode("utf-8")
+    raise FileNotFoundError(f"Archive blob {digest} not found")
+
+# ──────────────────────────────────────────────────────────────────────────────
+# RUN ARCHIVE
+# ──────────────────────────────────────────────────────────────────────────────
+class PageArchive:
+    """
+    Raw HTML of every page fetched in one run. Saving never fails a scrape:
+    errors are logged and the page is simply not archived.
+    """
+
+    def __init__(self, run_id, directory=ARCHIVE_DIR, level=ARCHIVE_LEVEL):
+        self.run_id = run_id
+        self.directory = directory
+        self.level = level
+        self.index = Checkpoint(run_id, "pages", _runs_dir(directory))
+        self.saved = 0
+
+    async def save(self, pool, url, html, profile, cost, timestamp):
+        """Store the page on `pool` (compression is CPU bound) and index it."""
+        try:
+            loop = asyncio.get_running_loop()
+            digest = await loop.run_in_executor(pool, store_blob, self.directory, html, self.level)
+            self.index.append({"url": url, "timestamp": timestamp, "profile": profile, "cost": cost, "sha": digest})
+            self.saved += 1
+        except Exception as e:
+            logger.warning(f"Could not archive page: {type(e).__name__}: {e}")
+
+    def records(self):
+        return self.index.records()
+
+    def close(self):
+        logger.info(f"Archived {self.saved} pages for run {self.run_id}.")
+        prune(self.directory)
+
+def open_archive(run_id):
+    """PageArchive for `run_id`, or None when ARCHIVE_ENABLED is off."""
+    return PageArchive(run_id) if ARCHIVE_ENABLED else None
+
+# ──────────────────────────────────────────────────────────────────────────────
+# RETENTION
+# ──────────────────────────────────────────────────────────────────────────────
+def _run_files(directory):
+    runs = _runs_dir(directory)
+    if not os.path.isdir(runs):
+        return []
+    files = [os.path.join(runs, f) for f in os.listdir(runs) if f.endswith("-pages.jsonl")]
+    return sorted(files, key=os.path.getmtime, reverse=True)
+
+def _blob_sizes(directory, settle=600):
+    """
+    {digest: (path, bytes)} of every stored blob, except the ones written in the
+    last `settle` seconds (a running scrape stores the blob before indexing it).
+    """
+    sizes, cutoff = {}, time.time() - settle
+    for root, _, files in os.walk(_blobs_dir(directory)):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(CODECS) and os.path.getmtime(path) < cutoff:
+                sizes[name.split(".")[0]] = (path, os.path.getsize(path))
+    return sizes
+
+def _digests(run_file):
+    run_id = os.path.basename(run_file)[:-len("-pages.jsonl")]
+    return {r["sha"] for r in Checkpoint(run_id, "pages", os.path.dirname(run_file)).records()}
+
+def prune(directory=ARCHIVE_DIR, max_runs=ARCHIVE_MAX_RUNS, max_mb=ARCHIVE_MAX_MB):
+    """
+    Keep the newest `max_runs` runs, then drop the oldest kept runs while their
+    blobs take more than `max_mb` (the newest run is always kept). Blobs no
+    kept run references are deleted.
+    """
+    runs = _run_files(directory)
+    keep, dropped = runs[:max(1, max_runs)], runs[max(1, max_runs):]
+    digests = {run: _digests(run) for run in keep}
+    blobs = _blob_sizes(directory)
+
+    def kept_bytes():
+        referenced = set().union(*digests.values()) if digests else set()
+        return sum(size for digest, (_, size) in blobs.items() if digest in referenced)
+
+    while len(keep) > 1 and kept_bytes() > max_mb * 1024 * 1024:
+        run = keep.pop()
+        digests.pop(run)
+        dropped.append(run)
+
+    for run in dropped:
+        os.remove(run)
+    referenced = set().union(*digests.values()) if digests else set()
+    removed = [path for digest, (path, _) in blobs.items() if digest not in referenced]
+    for path in removed:
+        os.remove(path)
+    mb = kept_bytes() / 1024 / 1024
+    if dropped or removed:
+        logger.info(f"Archive pruned: {len(dropped)} runs and {len(removed)} pages removed, {mb:.1f} MB kept.")
+    return {"runs": len(keep), "dropped_runs": len(dropped), "removed_blobs": len(removed), "mb": round(mb, 1)}
+
+# ──────────────────────────────────────────────────────────────────────────────
+# OFFLINE RE-PARSE
+# ──────────────────────────────────────────────────────────────────────────────
+def reparse_record(directory, record):
+    """Attempt row for one archived page, as the live scrapers would have built it."""
+    # the fast profile is only accepted on its embedded JSON, like scrape_one does
+    html = load_blob(directory, record["sha"])
+    fields = extract_fields(html, DISCARD_PHRASE, mode="json" if record["profile"] == "fast" else None)
+    row = {
+        **fields,
+        "_url": record["url"],
+        "_timestamp": record["timestamp"],
+        "_status": fields["_status"],
+        "_api_cost": record["cost"],
+        "_profile": record["profile"],
+    }
+    if EXTRACT_OFFERS and fields["_status"] == "successed":
+        row["_offers"] = extract_offers(html, fields)
+    return row
+
+def reparse(run_ids, directory=ARCHIVE_DIR, load=True, progress=None):
+    """
+    Re-run the extractor over every page archived for `run_ids` (one run ID or
+    a list, e.g. a first pass and its retry run) and reload the database and
+    the planner state; links read successfully after those runs keep their
+    newer row. No network calls: the credits paid when the pages were fetched
+    are kept in api_cost_total. Returns the count of rows per status.
+    """
+    from app.services.first_scrapp import make_parse_pool  # first_scrapp imports this module
+
+    run_ids = [run_ids] if isinstance(run_ids, str) else list(run_ids)
+    if progress is not None:
+        progress.set_stage("reparsing")
+    records = [r for run_id in run_ids for r in Checkpoint(run_id, "pages", _runs_dir(directory)).records()]
+    if not records:
+        logger.warning(f"No archived pages for {run_ids}.")
+        return {}
+    logger.info(f"Re-parsing {len(records)} archived pages of {run_ids}..")
+
+    reducer = ScrapReducer()
+    with make_parse_pool() as pool:
+        for row in pool.map(partial(reparse_record, directory), records, chunksize=32):
+            reducer.add(row)
+    rows = list(reducer.rows())
+    stats = {}
+    for row in rows:
+        stats[row["status"]] = stats.get(row["status"], 0) + 1
+        if progress is not None:
+            progress.count(row["status"])
+    logger.info(f"Re-parsed {len(rows)} URLs: {stats}")
+    if load:
+        if progress is not None:
+            progress.set_stage("loading")
+        states_by_link = {state["catalog_link"]: state for state in get_link_states()}
+        # archived runs hold canonical links: write back to every original link
+        rows = list(expand(rows, group_links(states_by_link)))
+        # a link read successfully after this run keeps its newer row
+        fresh = [row for row in rows if not _newer_success(states_by_link.get(row["catalog_link"]), row)]
+        if len(fresh) < len(rows):
+            logger.info(f"{len(rows) - len(fresh)} links have a newer successful scrape, not overwritten.")
+        load_scrap(fresh)
+        load_offers(fresh)
+        # the planner must see the re-parsed status, or fixed links stay "failed" and get scraped again
+        save_link_states(next_states(fresh, states_by_link))
+    return stats
+
+def _newer_success(state, row):
+    last_success, scraped = parse_ts((state or {}).get("last_success")), parse_ts(row["timestamp"])
+    return last_success is not None and scraped is not None and last_success > scraped
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CLI:  python -m app.services.archive reparse <run_id> [<run_id> ...] [--dry-run] | prune
+# ──────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Raw page archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cmd = sub.add_parser("reparse", help="re-run the extractor over an archived run and reload the database")
+    cmd.add_argument("run_ids", nargs="+")
+    cmd.add_argument("--dry-run", action="store_true", help="parse only, do not touch the database")
+    sub.add_parser("prune", help="apply the retention limits now")
+    args = parser.parse_args()
+    if args.command == "reparse":
+        print(reparse(args.run_ids, load=not args.dry_run))
+    else:
+        print(prune())
@@ -8,3 +8,22 @@ def remain_budget():
     subscription_ended_at = response.json().get("subscription").get("period").get("end")
     data = f"Scrapping Finalizado\ncreditos restantes: {credist_left}\nfecha inicio de subscripcion: {subscription_started_at}\nfecha fin de subscripcion: {subscription_ended_at}"
     return data,credist_left
+
+
+def account_concurrency():
+    """Max concurrent requests allowed by the Scrapfly plan (None if unavailable)."""
+    url = f"https://api.scrapfly.io/account?key={SCRAP_KEY}"
+    try:
+        response = requests.get(url, timeout=10)
+        return int(response.json().get("subscription").get("max_concurrency"))
+    except Exception:
+        return None
+
+def account_credits():
+    """Scrape credits left in the current Scrapfly billing period (None if unavailable)."""
+    url = f"https://api.scrapfly.io/account?key={SCRAP_KEY}"
+    try:
+        response = requests.get(url, timeout=10)
+        return float(response.json().get("subscription").get("usage").get("scrape").get("remaining"))
+    except Exception:
+        return None
@@ -0,0 +1,82 @@
+from app.services import metrics
+from app.utils.logger import logger
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import re
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CONSTANTS
+# ──────────────────────────────────────────────────────────────────────────────
+# (kind, pattern) matched against the URL path in priority order: a catalog slug
+# can contain something that looks like a listing ID, so /p/MLA… wins.
+ID_PATTERNS = [
+    ("p", re.compile(r"/p/(MLA\d+)", re.I)),
+    ("up", re.compile(r"/up/(MLAU\d+)", re.I)),
+    ("item", re.compile(r"/(MLA)-?(\d{6,})", re.I)),
+]
+# Query parameters that change what the page shows (pdp_filters=item_id:… pins the
+# buy-box seller); everything else in the query string is tracking.
+KEEP_PARAMS = ("pdp_filters",)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# HELPERS
+# ──────────────────────────────────────────────────────────────────────────────
+def _kept_query(parts):
+    return urlencode([(k, v) for k, v in parse_qsl(parts.query) if k in KEEP_PARAMS], safe=":")
+
+def normalize_url(link):
+    """https, lower-case host, no fragment (#position=…), no tracking parameters and no trailing slash."""
+    parts = urlsplit(link.strip())
+    return urlunsplit(("https", parts.netloc.lower(), parts.path.rstrip("/") or "/", _kept_query(parts), ""))
+
+def canonical_key(link):
+    """
+    Product key of a MercadoLibre link: 'p:MLA123' (catalog), 'up:MLAU123'
+    (user product) or 'item:MLA123' (listing). Links without an ID fall back
+    to their normalized URL.
+    """
+    parts = urlsplit(link.strip())
+    for kind, pattern in ID_PATTERNS:
+        match = pattern.search(parts.path)
+        if match:
+            query = _kept_query(parts)
+            return f"{kind}:{''.join(match.groups()).upper()}" + (f"?{query}" if query else "")
+    return normalize_url(link)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CORE
+# ──────────────────────────────────────────────────────────────────────────────
+def group_links(links):
+    """
+    {canonical URL: [raw links]} where every raw link of one product shares
+    the canonical URL (the normalized form of the first link seen).
+    """
+    by_key, groups = {}, {}
+    for link in links:
+        key = canonical_key(link)
+        if key not in by_key:
+            by_key[key] = normalize_url(link)
+            groups[by_key[key]] = []
+        if link not in groups[by_key[key]]:
+            groups[by_key[key]].append(link)
+    return groups
+
+def dedupe(links, aliases=None):
+    """
+    Canonical URLs to scrape for `links`, each product once (in order of first
+    appearance). `aliases` is a group_links() over a superset of `links`.
+    Logs how many requests the dedup saved.
+    """
+    aliases = aliases if aliases is not None else group_links(links)
+    canonical_of = {raw: url for url, raws in aliases.items() for raw in raws}
+    urls = list(dict.fromkeys(canonical_of.get(link) or normalize_url(link) for link in links))
+    saved = len(links) - len(urls)
+    if saved:
+        metrics.DEDUP_SAVED.inc(saved)
+    logger.info(f"Dedup: {len(links)} links -> {len(urls)} products ({saved} requests saved).")
+    return urls
+
+def expand(rows, aliases, key="catalog_link"):
+    """One copy of every scraped row per original link of its product."""
+    for row in rows:
+        for link in aliases.get(row[key]) or [row[key]]:
+            yield {**row, key: link}
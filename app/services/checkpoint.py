@@ -0,0 +1,72 @@
+from app.settings.config import CHECKPOINT_DIR
+from app.utils.logger import logger
+from datetime import datetime
+import os, json, uuid, threading
+
+# ──────────────────────────────────────────────────────────────────────────────
+# HELPERS
+# ──────────────────────────────────────────────────────────────────────────────
+def new_run_id():
+    """Sortable, unique run identifier (e.g. 20260118T0301-3f2a9c)."""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M')}-{uuid.uuid4().hex[:6]}"
+
+def latest_run_id(name="", directory=CHECKPOINT_DIR):
+    """Run ID of the most recently written checkpoint (of stage `name`, if given), or None."""
+    if not os.path.isdir(directory):
+        return None
+    files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(f"{name}.jsonl")]
+    if not files:
+        return None
+    newest = os.path.basename(max(files, key=os.path.getmtime))
+    return newest.rsplit("-", 1)[0]
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CORE: append-only JSONL log
+# ──────────────────────────────────────────────────────────────────────────────
+class Checkpoint:
+    """
+    Append-only JSONL log of finished work for one run and one stage
+    (`<dir>/<run_id>-<name>.jsonl`). Every record is flushed as soon as it is
+    written, so a crash loses at most the request that was in flight.
+    On Cloud Run, point CHECKPOINT_DIR to a persistent mount.
+    """
+
+    def __init__(self, run_id, name, directory=CHECKPOINT_DIR, reset=False):
+        self.run_id = run_id
+        self.path = os.path.join(directory, f"{run_id}-{name}.jsonl")
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        if reset and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def records(self):
+        """Every record written so far (a torn last line from a crash is skipped)."""
+        if not os.path.exists(self.path):
+            return []
+        out = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    out.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Skipping corrupt checkpoint line in {self.path}")
+        return out
+
+def open_checkpoint(name, run_id=None, resume=False):
+    """
+    Checkpoint for `name`: a resumed run reopens `run_id` (or the latest run),
+    a fresh run starts an empty log.
+    """
+    if resume:
+        run_id = run_id or latest_run_id(name)
+    if not run_id:
+        run_id, resume = new_run_id(), False
+    logger.info(f"Run {run_id} ({'resuming' if resume else 'new'}) - checkpoint {name}")
+    return Checkpoint(run_id, name, reset=not resume)
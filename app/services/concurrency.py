@@ -0,0 +1,144 @@
+from app.utils.logger import logger
+from app.services.budget import account_concurrency
+from app.settings.config import (
+    SCRAP_CONCURRENCY_FLOOR, SCRAP_CONCURRENCY_CEILING, SCRAP_CONCURRENCY_INITIAL, SCRAP_TARGET_LATENCY,
+)
+from concurrent.futures import ThreadPoolExecutor
+import asyncio, time
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CONSTANTS
+# ──────────────────────────────────────────────────────────────────────────────
+# Scrapfly error code prefixes that mean "slow down" (see scrapfly.errors)
+BACKOFF_CODES = ("ERR::THROTTLE", "ERR::ASP", "ERR::PROXY", "ERR::SESSION")
+BACKOFF_HTTP = (429, 503)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# HELPERS
+# ──────────────────────────────────────────────────────────────────────────────
+def error_code(exc):
+    """Scrapfly error code of an exception ("" for non Scrapfly errors)."""
+    return str(getattr(exc, "code", "") or "")
+
+def is_backoff_error(exc):
+    """True when the error means the account / proxy pool is overloaded or blocked."""
+    code = error_code(exc)
+    status = getattr(exc, "http_status_code", None)
+    return code.startswith(BACKOFF_CODES) or status in BACKOFF_HTTP or type(exc).__name__ == "TooManyConcurrentRequest"
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CORE: AIMD limiter
+# ──────────────────────────────────────────────────────────────────────────────
+class AdaptiveLimiter:
+    """
+    Concurrency limiter with additive-increase / multiplicative-decrease.
+
+    - every healthy response (latency under `target_latency`) adds ~1 slot per
+      window of `limit` responses;
+    - a throttle / ASP / proxy error or a slow response multiplies the limit by
+      `decrease` (at most once per `cooldown` seconds) and, for errors, pauses
+      new requests for the Retry-After delay;
+    - the limit always stays inside [floor, ceiling].
+    """
+
+    def __init__(self, floor=1, ceiling=10, initial=None, target_latency=45.0,
+                 decrease=0.5, cooldown=5.0):
+        self.floor = max(1, int(floor))
+        self.ceiling = max(self.floor, int(ceiling))
+        self.limit = float(min(self.ceiling, max(self.floor, initial or self.floor)))
+        self.target_latency = target_latency
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._changed = asyncio.Event()
+
+    # ---- slots ----
+    async def acquire(self):
+        while True:
+            wait = self._paused_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+    def try_acquire(self):
+        """Take a slot only if one is free right now (no waiting)."""
+        if self.pause_remaining() > 0 or self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._changed.set()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    # ---- feedback ----
+    def record(self, latency=None, exc=None):
+        """Feed one request outcome back into the controller."""
+        if exc is not None:
+            if is_backoff_error(exc):
+                delay = getattr(exc, "retry_delay", None) or 2.0
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self._shrink(f"{error_code(exc) or type(exc).__name__}")
+            return
+        if latency is not None and latency > self.target_latency:
+            self._shrink(f"latency {latency:.1f}s")
+            return
+        self.limit = min(self.ceiling, self.limit + 1 / self.limit)
+        self._changed.set()
+
+    def pause_remaining(self):
+        """Seconds left of the current backoff pause (0 when healthy)."""
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def _shrink(self, reason):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.floor, self.limit * self.decrease)
+        logger.warning(f"Concurrency down to {int(self.limit)} ({reason})..")
+
+
+def make_limiter():
+    """Limiter sized from the settings, capped by the account's concurrency limit."""
+    ceiling = SCRAP_CONCURRENCY_CEILING
+    account_limit = account_concurrency()
+    if account_limit:
+        ceiling = min(ceiling, account_limit)
+    logger.info(f"Concurrency limits: floor={SCRAP_CONCURRENCY_FLOOR} ceiling={ceiling}")
+    return AdaptiveLimiter(
+        floor=SCRAP_CONCURRENCY_FLOOR,
+        ceiling=ceiling,
+        initial=SCRAP_CONCURRENCY_INITIAL,
+        target_latency=SCRAP_TARGET_LATENCY,
+    )
+
+def size_client_pool(client, limiter):
+    """
+    Give `client` a request thread pool as large as the limiter's ceiling.
+    ScrapflyClient.async_scrape runs each request on `client.async_executor`, a
+    default ThreadPoolExecutor of min(32, cpus + 4) threads: left alone it caps
+    concurrency below the ceiling, and the time a request waits for a thread
+    reads as upstream latency. Every running request holds a limiter slot
+    (hedges and their losers included), so the ceiling is enough. Shut the
+    pool down (client.async_executor.shutdown) after the run.
+    """
+    previous = getattr(client, "async_executor", None)
+    if previous is not None:
+        previous.shutdown(wait=False)
+    client.async_executor = ThreadPoolExecutor(max_workers=limiter.ceiling, thread_name_prefix="scrapfly")
+    return client
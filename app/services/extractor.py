@@ -0,0 +1,384 @@
+from app.settings.config import EXTRACTOR_BACKEND, EXTRACTOR_MODE
+from bs4 import BeautifulSoup
+import json, re
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:  # lxml missing -> only the BeautifulSoup backend is available
+    etree = lxml_html = None
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CONSTANTS
+# ──────────────────────────────────────────────────────────────────────────────
+DISCARD_PHRASE = "Este producto no está disponible. Elige otra variante."
+# The PDP seller header reads "Vendido por <seller>"
+SELLER_PREFIX = "Vendido por"
+
+# Field defaults, shared by every backend (and by callers building error rows)
+EMPTY_FIELDS = {
+    "title": "n/a",
+    "price": "",
+    "competitor": "n/a",
+    "price_in_installments": "n/a",
+    "image": "n/a",
+}
+
+# ──────────────────────────────────────────────────────────────────────────────
+# BACKEND: BeautifulSoup (html.parser) - reference behaviour
+# ──────────────────────────────────────────────────────────────────────────────
+def _extract_bs4(html, discard_phrase):
+    soup = BeautifulSoup(html, "html.parser")
+
+    msg_el = soup.find(class_="ui-pdp-shipping-message__text")
+    if msg_el and discard_phrase in msg_el.get_text(strip=True):
+        return {**EMPTY_FIELDS, "_status": "discarded"}
+
+    t = soup.find("h1", class_="ui-pdp-title")
+    precio_container = soup.find("div", {"class": "ui-pdp-price__second-line"})
+    p = precio_container.find("span", {"class": "andes-money-amount__fraction"}) if precio_container else None
+    c = soup.find("h2", class_="ui-seller-data-header__title")
+    q = soup.find("div", class_="ui-pdp-price__subtitles")
+    img = soup.find("img", class_="ui-pdp-image")
+    return {
+        "title": (t.text.strip() if t else "n/a"),
+        "price": (p.text.strip() if p else ""),
+        "competitor": (c.text.strip() if c else "n/a"),
+        "price_in_installments": (q.text.strip() if q else "n/a"),
+        "image": (img["src"] if (img and img.get("src")) else "n/a"),
+        "_status": "successed",
+    }
+
+# ──────────────────────────────────────────────────────────────────────────────
+# BACKEND: lxml with precompiled XPath - fast path
+# ──────────────────────────────────────────────────────────────────────────────
+def _has_class(name):
+    """XPath predicate matching a whole token of the class attribute (like bs4 class_=)."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+if etree is not None:
+    _HTML_PARSER = lxml_html.HTMLParser(encoding="utf-8")
+    _XP_DISCARD = etree.XPath(f"(//*[{_has_class('ui-pdp-shipping-message__text')}])[1]")
+    _XP_TITLE = etree.XPath(f"(//h1[{_has_class('ui-pdp-title')}])[1]")
+    _XP_PRICE_BOX = etree.XPath(f"(//div[{_has_class('ui-pdp-price__second-line')}])[1]")
+    _XP_PRICE = etree.XPath(f"(.//span[{_has_class('andes-money-amount__fraction')}])[1]")
+    _XP_SELLER = etree.XPath(f"(//h2[{_has_class('ui-seller-data-header__title')}])[1]")
+    _XP_INSTALLMENTS = etree.XPath(f"(//div[{_has_class('ui-pdp-price__subtitles')}])[1]")
+    _XP_IMAGE = etree.XPath(f"(//img[{_has_class('ui-pdp-image')}])[1]")
+    # bs4 get_text() leaves out <script>/<style>/<template> contents
+    _XP_TEXT = etree.XPath(".//text()[not(ancestor::script or ancestor::style or ancestor::template)]")
+
+def _first(xpath, node):
+    found = xpath(node)
+    return found[0] if found else None
+
+def _text(el):
+    return "".join(_XP_TEXT(el)).strip()
+
+def _extract_lxml(html, discard_phrase):
+    if isinstance(html, str):
+        html = html.encode("utf-8")
+    try:
+        root = lxml_html.fromstring(html, parser=_HTML_PARSER)
+    except (etree.ParserError, ValueError):
+        # Empty / unparseable document: same outcome as bs4 finding nothing
+        return {**EMPTY_FIELDS, "_status": "successed"}
+
+    msg_el = _first(_XP_DISCARD, root)
+    if msg_el is not None:
+        stripped = "".join(s.strip() for s in _XP_TEXT(msg_el))
+        if discard_phrase in stripped:
+            return {**EMPTY_FIELDS, "_status": "discarded"}
+
+    t = _first(_XP_TITLE, root)
+    precio_container = _first(_XP_PRICE_BOX, root)
+    p = _first(_XP_PRICE, precio_container) if precio_container is not None else None
+    c = _first(_XP_SELLER, root)
+    q = _first(_XP_INSTALLMENTS, root)
+    img = _first(_XP_IMAGE, root)
+    return {
+        "title": (_text(t) if t is not None else "n/a"),
+        "price": (_text(p) if p is not None else ""),
+        "competitor": (_text(c) if c is not None else "n/a"),
+        "price_in_installments": (_text(q) if q is not None else "n/a"),
+        "image": (img.get("src") if (img is not None and img.get("src")) else "n/a"),
+        "_status": "successed",
+    }
+
+BACKENDS = {"bs4": _extract_bs4}
+if etree is not None:
+    BACKENDS["lxml"] = _extract_lxml
+
+# ──────────────────────────────────────────────────────────────────────────────
+# EMBEDDED JSON: JSON-LD + preloaded state blob
+# ──────────────────────────────────────────────────────────────────────────────
+_RE_LD_JSON = re.compile(r'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.S | re.I)
+_RE_STATE_TAG = re.compile(r'<script[^>]*id=["\']__PRELOADED_STATE__["\'][^>]*>(.*?)</script>', re.S | re.I)
+_RE_STATE_ASSIGN = re.compile(r'window\.__PRELOADED_STATE__\s*=\s*(\{.*?\});?\s*</script>', re.S)
+
+def _loads(raw):
+    try:
+        return json.loads(raw.strip())
+    except (ValueError, TypeError):
+        return None
+
+def _ld_products(node):
+    """Yield every schema.org Product found in a JSON-LD payload (lists and @graph included)."""
+    if isinstance(node, list):
+        for item in node:
+            yield from _ld_products(item)
+    elif isinstance(node, dict):
+        if node.get("@type") == "Product":
+            yield node
+        yield from _ld_products(node.get("@graph", []))
+
+def _find_first(node, key):
+    """Depth-first lookup of the first value stored under `key`."""
+    if isinstance(node, dict):
+        if key in node:
+            return node[key]
+        node = list(node.values())
+    if isinstance(node, list):
+        for item in node:
+            found = _find_first(item, key)
+            if found is not None:
+                return found
+    return None
+
+def _format_price(value):
+    """Render a JSON price the way the PDP shows the fraction (12345.5 -> '12.345')."""
+    try:
+        return f"{int(float(value)):,}".replace(",", ".")
+    except (TypeError, ValueError):
+        return ""
+
+def _ld_buy_box(offers):
+    """The buy-box offer of a JSON-LD Product: its Offer, or the first one of an AggregateOffer."""
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    if not isinstance(offers, dict):
+        return {}
+    if offers.get("offers"):
+        first = _ld_buy_box(offers["offers"])
+        return {**first, "price": first.get("price") or offers.get("lowPrice")}
+    return {**offers, "price": offers.get("price") or offers.get("lowPrice")}
+
+def _state_components(state):
+    """initialState.components of the preloaded state ({} when missing)."""
+    initial = _find_first(state, "initialState")
+    components = initial.get("components") if isinstance(initial, dict) else None
+    return components if isinstance(components, dict) else {}
+
+def _state_buy_box(components):
+    """
+    Title, seller and price of the buy box: components.header.title,
+    components.seller.seller_info and components.price.price.value only -
+    recommendation carousels elsewhere in the state carry sellers and prices too.
+    """
+    header, seller, price = (components.get(k) for k in ("header", "seller", "price"))
+    title = header.get("title") if isinstance(header, dict) else None
+    seller = _seller_name(seller.get("seller_info")) if isinstance(seller, dict) else None
+    price = price.get("price") if isinstance(price, dict) else None
+    price = price.get("value") if isinstance(price, dict) else None
+    return (
+        title.strip() if isinstance(title, str) else None,
+        seller,
+        price if isinstance(price, (int, float)) else None,
+    )
+
+def extract_json_fields(html):
+    """
+    Read title, price, seller and image from the JSON embedded in the page.
+    Returns only the fields that were found, or None when the page carries no product JSON.
+    """
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    found = {}
+
+    for raw in _RE_LD_JSON.findall(html):
+        for product in _ld_products(_loads(raw)):
+            offers = _ld_buy_box(product.get("offers"))
+            image = product.get("image")
+            if isinstance(image, list):
+                image = image[0] if image else None
+            seller = offers.get("seller") or {}
+            candidates = {
+                "title": (product.get("name") or "").strip(),
+                "price": _format_price(offers.get("price")),
+                "image": image if isinstance(image, str) else None,
+                "competitor": (seller.get("name") if isinstance(seller, dict) else None),
+            }
+            for key, value in candidates.items():
+                if value and not found.get(key):
+                    found[key] = value
+
+    state_raw = _RE_STATE_TAG.search(html) or _RE_STATE_ASSIGN.search(html)
+    components = _state_components(_loads(state_raw.group(1)) if state_raw else None)
+    title, seller, price = _state_buy_box(components)
+    for key, value in (("title", title), ("competitor", seller), ("price", _format_price(price))):
+        if value and not found.get(key):
+            found[key] = value
+
+    found = {k: v for k, v in found.items() if v}
+    if not found.get("title") or not found.get("price"):
+        return None
+    return found
+
+def _merge_json(fields, js):
+    """
+    Overlay JSON values on the DOM fields; DOM fills whatever the JSON lacks.
+    The seller is written the way the DOM header shows it, so a link read by
+    either path stores the same row. Only the DOM's variant-unavailable
+    message discards a page (the JSON availability is not used).
+    """
+    if js.get("competitor"):
+        js = {**js, "competitor": f"{SELLER_PREFIX} {js['competitor']}"}
+    return {**fields, **js, "_status": "successed", "_source": "json"}
+
+# ──────────────────────────────────────────────────────────────────────────────
+# SELLER OFFERS: every seller a catalog page lists (buy box + other buying options)
+# ──────────────────────────────────────────────────────────────────────────────
+# "Otras opciones de compra" rows on a catalog PDP
+OFFER_ROW_CLASS = "ui-pdp-other-sellers__item"
+OFFER_SELLER_CLASS = "ui-pdp-other-sellers__seller"
+_RE_ITEM_ID = re.compile(r"(MLA)-?(\d{6,})", re.I)
+
+if etree is not None:
+    _XP_OFFER_ROWS = etree.XPath(f"//*[{_has_class(OFFER_ROW_CLASS)}]")
+    _XP_OFFER_SELLER = etree.XPath(f"(.//*[{_has_class(OFFER_SELLER_CLASS)}])[1]")
+    _XP_OFFER_LINK = etree.XPath("(.//a/@href)[1]")
+
+def _item_id(value):
+    match = _RE_ITEM_ID.search(str(value or ""))
+    return "".join(match.groups()).upper() if match else None
+
+def _seller_name(node):
+    if isinstance(node, dict):
+        return node.get("name") or node.get("title") or node.get("nickname")
+    return node if isinstance(node, str) else None
+
+def _ld_offers(html):
+    """Offer dicts of the JSON-LD Product (Offer, list of Offer or AggregateOffer.offers)."""
+    for raw in _RE_LD_JSON.findall(html):
+        for product in _ld_products(_loads(raw)):
+            offers = product.get("offers") or []
+            if isinstance(offers, dict):
+                offers = offers.get("offers") or [offers]
+            for offer in offers if isinstance(offers, list) else []:
+                if isinstance(offer, dict):
+                    yield {
+                        "seller": _seller_name(offer.get("seller")),
+                        "price": _format_price(offer.get("price")),
+                        "item_id": _item_id(offer.get("url") or offer.get("sku")),
+                    }
+
+# Preloaded-state components that hold offers of this product; recommendation
+# carousels and similar items elsewhere in the state also carry seller + price
+STATE_OFFER_COMPONENTS = ("buy_box_offer", "other_sellers", "other_buying_options")
+
+def _state_items(node, product_id):
+    """Dicts under `node` that carry a seller and a numeric price."""
+    if isinstance(node, list):
+        for item in node:
+            yield from _state_items(item, product_id)
+    elif isinstance(node, dict):
+        seller = _seller_name(node.get("seller_info") or node.get("seller"))
+        price = node.get("price")
+        price = price.get("value") if isinstance(price, dict) else price
+        catalog_id = node.get("catalog_product_id")
+        if seller and isinstance(price, (int, float)):
+            if not (catalog_id and product_id and _item_id(catalog_id) != product_id):
+                yield {"seller": seller, "price": _format_price(price), "item_id": _item_id(node.get("item_id") or node.get("id"))}
+        else:
+            for value in node.values():
+                yield from _state_items(value, product_id)
+
+def _state_offers(state):
+    """Buy box (seller + price components) and offer components of the preloaded state."""
+    components = _state_components(state)
+    if not components:
+        return
+    initial = _find_first(state, "initialState")
+    product_id = _item_id(initial.get("id"))
+    _, seller, price = _state_buy_box(components)
+    if seller and price is not None:
+        yield {"seller": seller, "price": _format_price(price), "item_id": None}
+    for name in STATE_OFFER_COMPONENTS:
+        yield from _state_items(components.get(name), product_id)
+
+def _dom_offers(html):
+    if etree is not None:
+        try:
+            root = lxml_html.fromstring(html.encode("utf-8"), parser=_HTML_PARSER)
+        except (etree.ParserError, ValueError):
+            return
+        for row in _XP_OFFER_ROWS(root):
+            seller, price = _first(_XP_OFFER_SELLER, row), _first(_XP_PRICE, row)
+            yield {
+                "seller": _text(seller) if seller is not None else None,
+                "price": _text(price) if price is not None else "",
+                "item_id": _item_id(_first(_XP_OFFER_LINK, row)),
+            }
+        return
+    for row in BeautifulSoup(html, "html.parser").find_all(class_=OFFER_ROW_CLASS):
+        seller = row.find(class_=OFFER_SELLER_CLASS)
+        price = row.find("span", class_="andes-money-amount__fraction")
+        link = row.find("a", href=True)
+        yield {
+            "seller": seller.get_text(strip=True) if seller else None,
+            "price": price.get_text(strip=True) if price else "",
+            "item_id": _item_id(link["href"] if link else None),
+        }
+
+def extract_offers(html, buy_box=None):
+    """
+    Every seller offer of a catalog page, buy box first:
+    [{"position", "seller", "price", "item_id"}]. Reads the JSON-LD offers, the
+    preloaded state and the "other buying options" rows; the same seller at
+    the same price is listed once. `buy_box` (extract_fields output) seeds
+    position 0 when the page embeds no offer data.
+    """
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    html = html or ""
+    candidates = list(_ld_offers(html))
+    state_raw = _RE_STATE_TAG.search(html) or _RE_STATE_ASSIGN.search(html)
+    candidates += list(_state_offers(_loads(state_raw.group(1)) if state_raw else None))
+    if buy_box and buy_box.get("competitor") not in (None, "n/a"):
+        candidates.insert(0, {"seller": buy_box["competitor"], "price": buy_box.get("price") or "", "item_id": None})
+    candidates += list(_dom_offers(html))
+
+    offers, seen = [], {}
+    for offer in candidates:
+        seller = re.sub(rf"^{SELLER_PREFIX}\s+", "", (offer["seller"] or "").strip(), flags=re.I)
+        if not seller or not offer["price"]:
+            continue
+        key = (seller.lower(), offer["price"])
+        if key in seen:
+            # keep the first position, fill an item ID found by a later source
+            seen[key]["item_id"] = seen[key]["item_id"] or offer["item_id"]
+            continue
+        seen[key] = {"position": len(offers), "seller": seller, "price": offer["price"], "item_id": offer["item_id"]}
+        offers.append(seen[key])
+    return offers
+
+# ──────────────────────────────────────────────────────────────────────────────
+# PUBLIC API
+# ──────────────────────────────────────────────────────────────────────────────
+def extract_fields(html, discard_phrase=DISCARD_PHRASE, backend=None, mode=None):
+    """
+    Extract the product fields of a PDP.
+    Returns the field dict plus `_status` ("successed" | "discarded" | "failed")
+    and `_source` ("json" when the embedded JSON was used, else "dom").
+    Unknown / unavailable backends fall back to BeautifulSoup.
+    mode="json" prefers the embedded JSON and completes it with the DOM fields.
+    """
+    fn = BACKENDS.get(backend or EXTRACTOR_BACKEND, _extract_bs4)
+    fields = fn(html or "", discard_phrase)
+    fields["_source"] = "dom"
+    if (mode or EXTRACTOR_MODE) == "json" and fields["_status"] != "discarded":
+        js = extract_json_fields(html or "")
+        if js:
+            fields = _merge_json(fields, js)
+    if fields["_status"] == "successed" and fields["title"] == "n/a":
+        fields["_status"] = "failed"
+    return fields
@@ -1,10 +1,19 @@
 from app.utils.logger import logger
 from app.database.db_manager import get_urls
-from app.settings.config import SCRAP_KEY
-import os, json, asyncio, uuid, random
+from app.settings.config import (
+    SCRAP_KEY, PARSE_POOL_KIND, PARSE_POOL_WORKERS, SCRAP_FAST_PATH, HEDGE_ENABLED, EXTRACT_OFFERS,
+)
+from app.services.concurrency import make_limiter, size_client_pool
+from app.services.checkpoint import open_checkpoint
+from app.services.hedging import Hedger
+from app.services import metrics
+from app.services.archive import open_archive
+from app.services.canonical import dedupe
+import os, json, asyncio, uuid, time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from scrapfly import ScrapflyClient, ScrapeConfig
+from app.services.extractor import extract_fields, extract_offers, DISCARD_PHRASE
 from datetime import datetime
-from bs4 import BeautifulSoup
 
 # ──────────────────────────────────────────────────────────────────────────────
 # PATHS / CONSTANTS
@@ -13,7 +22,22 @@ BASE_DIR = os.path.dirname(__file__)
 DATABASE_DIR = os.path.join(BASE_DIR, "../database")
 URLS_JSON = os.path.join(DATABASE_DIR, "urls.json")
 RESULTS_JSON = os.path.join(DATABASE_DIR, "scrap_results.json")
-DISCARD_PHRASE = "Este producto no está disponible. Elige otra variante."
+
+# Request profiles: "fast" skips the browser and relies on the embedded JSON,
+# "rendered" is the full JS render used when the JSON is missing.
+_BASE_PROFILE = dict(
+    asp=True,
+    proxy_pool="public_residential_pool",
+    country="ar",
+    lang=["es-AR", "es"],
+    retry=False,
+    cost_budget=30,
+    session_sticky_proxy=True,
+)
+SCRAPE_PROFILES = {
+    "fast": {**_BASE_PROFILE, "render_js": False, "timeout": 30_000},
+    "rendered": {**_BASE_PROFILE, "render_js": True, "rendering_stage": "complete", "timeout": 90_000},
+}
 
 # ──────────────────────────────────────────────────────────────────────────────
 # HELPERS
@@ -35,86 +59,135 @@ def api_cost(response):
     cost = getattr(getattr(response, "response", None), "headers", {}).get("X-Scrapfly-Api-Cost", "n/a")
     return cost
 
+def add_cost(*costs):
+    """Sum Scrapfly costs, ignoring the "n/a" placeholders."""
+    values = [float(c) for c in costs if str(c).replace(".", "", 1).isdigit()]
+    return str(int(sum(values))) if values else "n/a"
+
+def build_config(url, profile, session_id):
+    """ScrapeConfig for one of the SCRAPE_PROFILES."""
+    return ScrapeConfig(url=url, session=session_id, **SCRAPE_PROFILES[profile])
+
+async def fetch(client, cfg, limiter=None, hedger=None, profile=None, governor=None):
+    """
+    Run one Scrapfly request, feeding latency / errors back to the limiter.
+    With a `hedger`, slow requests are raced against a second one.
+    `profile` labels the request in the metrics (first-pass profile or ladder stage).
+    `governor` (governor.CreditGovernor) is charged the request's credits.
+    """
+    started = time.monotonic()
+    try:
+        if hedger is not None:
+            res = await hedger.scrape(client, cfg, limiter, profile)
+        else:
+            res = await client.async_scrape(cfg)
+    except Exception as e:
+        metrics.REQUEST_SECONDS.observe(time.monotonic() - started, profile=profile, outcome=metrics.outcome(e))
+        if limiter is not None:
+            limiter.record(exc=e)
+        raise
+    latency = time.monotonic() - started
+    metrics.REQUEST_SECONDS.observe(latency, profile=profile, outcome="ok")
+    cost = add_cost(api_cost(res))
+    if cost != "n/a":
+        metrics.CREDITS.inc(int(cost), profile=profile)
+    if governor is not None:
+        governor.charge(profile, cost)
+    if limiter is not None:
+        limiter.record(latency=latency)
+    return res
+
+def make_parse_pool(kind=PARSE_POOL_KIND, workers=PARSE_POOL_WORKERS):
+    """Build the executor that runs the HTML parsing stage off the event loop."""
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="parse")
+
+# ──────────────────────────────────────────────────────────────────────────────
+# PARSE STAGE (runs inside the parse pool, must stay picklable)
+# ──────────────────────────────────────────────────────────────────────────────
+def parse_html(html, url, discard_phrase, cost, mode=None):
+    """
+    Parse a fetched PDP and return the result row.
+    CPU bound: called through the parse pool, never on the event loop.
+    """
+    fields = extract_fields(html, discard_phrase, mode=mode)
+    row = {
+        **fields,
+        "_url": url,
+        "_timestamp": now_ts(),
+        "_status": fields["_status"],
+        "_api_cost": cost,
+    }
+    if EXTRACT_OFFERS and fields["_status"] == "successed":
+        row["_offers"] = extract_offers(html, fields)
+    return row
+
 # ──────────────────────────────────────────────────────────────────────────────
 # CORE:
 # ──────────────────────────────────────────────────────────────────────────────
-async def scrape_one(client, url, discard_phrase):
+async def scrape_one(client, url, discard_phrase, parse_pool=None, limiter=None, start_profile="fast", hedger=None,
+                     archive=None, governor=None):
     """
-    Scrape one URL and return a tuple describing the result.
+    Scrape one URL and return a dict describing the result.
+    The event loop only does the network I/O; parsing is handed to `parse_pool`.
+    start_profile="rendered" skips the fast path (URLs known to need a browser).
+    With an `archive` (archive.PageArchive) every fetched page is kept for offline re-parsing.
+    A `governor` (governor.CreditGovernor) is charged every request and told each profile's outcome.
     """
+    spent = "n/a"
     try:
         # create a unique session ID per scrape
         session_id = str(uuid.uuid4())
+        loop = asyncio.get_running_loop()
+        parsed = None
 
-        # 1. Build request config
-        cfg = ScrapeConfig(
-            url=url,
-            asp=True,
-            render_js=True,
-            rendering_stage="complete",
-            proxy_pool="public_residential_pool",
-            country="ar",
-            lang=["es-AR", "es"],
-            retry=False,
-            timeout=90_000,
-            cost_budget=30,
-            session=session_id,
-            session_sticky_proxy=True,
-        )
-
-        # 2. Execute scrapping
-        res = await client.async_scrape(cfg)
-        html = res.content
-        soup = BeautifulSoup(html, "html.parser")
-
-        # 3. Check availability
-        msg_el = soup.find(class_="ui-pdp-shipping-message__text")
-        if msg_el and discard_phrase in msg_el.get_text(strip=True):
-            parsed = {
-                "title": "n/a",
-                "price": "",
-                "competitor": "n/a",
-                "price_in_installments": "n/a",
-                "image": "n/a",
-                "_url": url,
-                "_timestamp": now_ts(),
-                "_status": "discarded",
-                "_api_cost": api_cost(res)
-            }
-            logger.warning(f"Discarded (not available)..")
-            return parsed
-
-        # 4. Extract fields & Parsing
-        t = soup.find("h1", class_="ui-pdp-title")
-        precio_container = soup.find("div", {"class": "ui-pdp-price__second-line"})
-        p = precio_container.find("span", {"class": "andes-money-amount__fraction"}) if precio_container else None
-        c = soup.find("h2", class_="ui-seller-data-header__title")
-        q = soup.find("div", class_="ui-pdp-price__subtitles")
-        img = soup.find("img", class_="ui-pdp-image")
-        parsed = {
-            "title": (t.text.strip() if t else "n/a"),
-            "price": (p.text.strip() if p else ""),
-            "competitor": (c.text.strip() if c else "n/a"),
-            "price_in_installments": (q.text.strip() if q else "n/a"),
-            "image": (img["src"] if (img and img.get("src")) else "n/a"),
-            "_url": url,
-            "_timestamp": now_ts(),
-            "_status": "successed",
-            "_api_cost": api_cost(res),
-        }
+        # 1. Cheap try: no browser, read the embedded JSON
+        if SCRAP_FAST_PATH and start_profile == "fast":
+            try:
+                res = await fetch(client, build_config(url, "fast", session_id), limiter, hedger, "fast", governor)
+                spent = api_cost(res)
+                if archive is not None:
+                    await archive.save(parse_pool, url, res.content, "fast", spent, now_ts())
+                with metrics.PARSE_SECONDS.time(profile="fast"):
+                    parsed = await loop.run_in_executor(parse_pool, parse_html, res.content, url, discard_phrase, spent, "json")
+                parsed["_profile"] = "fast"
+                if parsed["_source"] != "json" and parsed["_status"] != "discarded":
+                    parsed = None
+            except Exception:
+                parsed = None
+            if governor is not None:
+                governor.done("fast", parsed is not None)
+            if parsed is None:
+                logger.info(f"No embedded JSON, escalating to rendered scrape..")
+
+        # 2. Rendered scrape + parse on the worker pool
+        if parsed is None:
+            res = await fetch(client, build_config(url, "rendered", session_id), limiter, hedger, "rendered", governor)
+            spent = add_cost(spent, api_cost(res))
+            if archive is not None:
+                await archive.save(parse_pool, url, res.content, "rendered", api_cost(res), now_ts())
+            with metrics.PARSE_SECONDS.time(profile="rendered"):
+                parsed = await loop.run_in_executor(parse_pool, parse_html, res.content, url, discard_phrase, spent)
+            parsed["_profile"] = "rendered"
+            if governor is not None:
+                governor.done("rendered", parsed["_status"] != "failed")
 
-        # 5. Validate if Failed
-        if parsed["title"] == "n/a":
-            parsed["_status"] = "failed"
+        # 4. Log outcome
+        metrics.RESULTS.inc(stage=parsed["_profile"], status=parsed["_status"])
+        if parsed["_status"] == "discarded":
+            logger.warning(f"Discarded (not available)..")
+        elif parsed["_status"] == "failed":
             logger.error(f"Failed to parse title.")
-            return parsed
-        
-        # 6. Validate if Successed
-        logger.info(f"Successed Scrapping..")
+        else:
+            logger.info(f"Successed Scrapping..")
         return parsed
     
     except Exception:
         logger.error(f"Exception while scraping..")
+        metrics.RESULTS.inc(stage="rendered", status="error")
+        if governor is not None:
+            governor.done("rendered", False)
         parsed = {
             "title": "n/a",
             "price": "",
@@ -124,17 +197,20 @@ async def scrape_one(client, url, discard_phrase):
             "_url": url,
             "_timestamp": now_ts(),
             "_status": "failed",
-            "_api_cost": "n/a",
+            "_api_cost": spent,
         }
         return parsed
 
-async def scrape_all(urls):
+async def scrape_all(urls, checkpoint=None, archive=None):
     """
     Orchestrates scraping for all URLs.
     Returns results, failures, and discarded URLs.
+    Each finished row is appended to `checkpoint` right away.
     """
-    client = ScrapflyClient(key=SCRAP_KEY)
-    sem = asyncio.Semaphore(5)  # limit concurrency
+    limiter = make_limiter()  # adaptive concurrency (AIMD)
+    hedger = Hedger() if HEDGE_ENABLED else None
+    client = size_client_pool(ScrapflyClient(key=SCRAP_KEY), limiter)
+    parse_pool = make_parse_pool()
 
     results = []
     # --- shared counter ---
@@ -143,28 +219,45 @@ async def scrape_all(urls):
     total = len(urls)
 
     async def job(url):
-        async with sem:
-            parsed = await scrape_one(client, url, DISCARD_PHRASE)
+        async with limiter:
+            parsed = await scrape_one(client, url, DISCARD_PHRASE, parse_pool, limiter, hedger=hedger, archive=archive)
             results.append(parsed)
+            if checkpoint is not None:
+                checkpoint.append(parsed)
             async with lock:
                 counter[0] += 1
-                logger.info(f"[{counter[0]}/{total}] finished..")
-            # add think-time delay
-            await asyncio.sleep(random.uniform(1.5, 3.5))
+                logger.info(f"[{counter[0]}/{total}] finished.. (concurrency {int(limiter.limit)})")
 
-    await asyncio.gather(*(job(u) for u in urls))
+    try:
+        await asyncio.gather(*(job(u) for u in urls))
+    finally:
+        parse_pool.shutdown(wait=True)
+        client.async_executor.shutdown(wait=False)
+    if hedger is not None:
+        logger.info(f"Hedging: {hedger.summary()}")
     return results
 
 # ──────────────────────────────────────────────────────────────────────────────
 # MAIN
 # ──────────────────────────────────────────────────────────────────────────────
-def scrap_meli_urls():
+def scrap_meli_urls(run_id=None, resume=False):
     """
     Entry point: load URLs, scrape, and save results.
+    With resume=True, URLs already finished in `run_id` (default: latest run) are skipped.
+    Returns the run ID.
     """
     logger.info("START - First Scrapping Method.")
-    urls = get_urls()
+    checkpoint = open_checkpoint("first", run_id, resume)
+    previous = checkpoint.records()
+    done = {row["_url"] for row in previous}
+    urls = [u for u in dedupe(get_urls()) if u not in done]
+    if done:
+        logger.info(f"Resuming: {len(done)} URLs already finished, {len(urls)} left.")
     #--- Run scraping ---
-    results = asyncio.run(scrape_all(urls))
-    write_json(RESULTS_JSON, results)
+    archive = open_archive(checkpoint.run_id)
+    results = asyncio.run(scrape_all(urls, checkpoint, archive))
+    if archive is not None:
+        archive.close()
+    write_json(RESULTS_JSON, previous + results)
     logger.info("END - First Scrapping Method.")
+    return checkpoint.run_id
@@ -0,0 +1,190 @@
+from app.settings.config import (
+    GOVERNOR_MAX_CREDITS, GOVERNOR_USE_ACCOUNT, GOVERNOR_RESERVE, GOVERNOR_MAX_STAGE, GOVERNOR_PRIOR_WEIGHT,
+    PLAN_DEFAULT_COST,
+)
+from app.services.budget import account_credits
+from app.services.profile_memory import PROFILE_LADDER, FIRST_PASS_PROFILES, rank
+from app.services.json_merge import cost_value
+from app.services import metrics
+from app.utils.logger import logger
+import asyncio
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CORE
+# ──────────────────────────────────────────────────────────────────────────────
+class CreditGovernor:
+    """
+    Keeps a run inside `ceiling` credits.
+
+    Every request is charged live (X-Scrapfly-Api-Cost) to its profile, and
+    every attempt outcome moves its URL down PROFILE_LADDER. The cost of the
+    URLs still in flight is projected from per-profile averages (cost and
+    failure rate, blended with a prior until enough requests are seen). When
+    the projection overshoots the ceiling the run degrades, in this order:
+    1. retry stages after `max_stage` are skipped for the rest of the run;
+    2. no new URLs are admitted (the rest of the plan waits for the next run);
+    3. no request is started once its expected cost no longer fits.
+    Runs on the event loop: not thread safe.
+    """
+
+    def __init__(self, ceiling, max_stage=GOVERNOR_MAX_STAGE, prior_cost=PLAN_DEFAULT_COST,
+                 prior_weight=GOVERNOR_PRIOR_WEIGHT, min_samples=20, hedger=None):
+        self.ceiling = float(ceiling)
+        self.cutoff = rank(max_stage)
+        self.prior_cost = prior_cost
+        self.prior_weight = prior_weight
+        self.min_samples = min_samples  # requests seen before the ladder can be trimmed
+        self.hedger = hedger  # hedged requests are billed too (Hedger.extra_credits)
+        self.credits = {}   # {profile: credits charged}
+        self.requests = {}  # {profile: requests charged}
+        self.failures = {}  # {profile: (failed attempts, attempts)}
+        self.pending = {}   # {profile: admitted URLs whose next attempt is at that profile}
+        self.in_flight = {}  # {profile: allowed attempts without an outcome yet}
+        self.skipped = {"stage": 0, "url": 0, "stop": 0}
+        self.trimmed = False
+        self.stopped = False
+
+    # ---- averages ----
+    @property
+    def spent(self):
+        return sum(self.credits.values()) + (self.hedger.extra_credits if self.hedger is not None else 0)
+
+    def cost(self, profile):
+        """Average credits per request of `profile`."""
+        w = self.prior_weight
+        return (self.credits.get(profile, 0) + self.prior_cost * w) / (self.requests.get(profile, 0) + w)
+
+    def fail_rate(self, profile):
+        failed, total = self.failures.get(profile, (0, 0))
+        return (failed + 0.5 * self.prior_weight) / (total + self.prior_weight)
+
+    def expected(self, profile, trimmed=False):
+        """Expected credits to finish a URL whose next attempt is `profile`."""
+        total, reach = 0.0, 1.0
+        for name in PROFILE_LADDER[rank(profile):]:
+            if trimmed and rank(name) > self.cutoff:
+                break
+            total += reach * self.cost(name)
+            reach *= self.fail_rate(name)
+        return total
+
+    @property
+    def reserved(self):
+        """Expected credits of the requests already started."""
+        return sum(n * self.cost(p) for p, n in self.in_flight.items() if n > 0)
+
+    def projected(self, trimmed=False):
+        return self.spent + sum(n * self.expected(p, trimmed) for p, n in self.pending.items() if n > 0)
+
+    # ---- bookkeeping (called by fetch / the scrapers) ----
+    def charge(self, profile, cost):
+        """One request of `profile` billed `cost` (the X-Scrapfly-Api-Cost header, "n/a" counts as 0)."""
+        self.credits[profile] = self.credits.get(profile, 0) + cost_value(cost)
+        self.requests[profile] = self.requests.get(profile, 0) + 1
+
+    def done(self, profile, ok):
+        """Outcome of one attempt: a failed URL moves on to the next profile of the ladder."""
+        failed, total = self.failures.get(profile, (0, 0))
+        self.failures[profile] = (failed + (not ok), total + 1)
+        self._move(profile, -1)
+        self.in_flight[profile] = max(0, self.in_flight.get(profile, 0) - 1)
+        if not ok and rank(profile) + 1 < len(PROFILE_LADDER):
+            self._move(PROFILE_LADDER[rank(profile) + 1], 1)
+            if profile == FIRST_PASS_PROFILES[0]:
+                # scrape_one escalates fast -> rendered without asking again
+                self.in_flight[FIRST_PASS_PROFILES[1]] = self.in_flight.get(FIRST_PASS_PROFILES[1], 0) + 1
+        self._update()
+
+    def _move(self, profile, n):
+        self.pending[profile] = max(0, self.pending.get(profile, 0) + n)
+
+    def _update(self):
+        projected = self.projected()
+        metrics.CREDITS_PROJECTED.set(round(projected, 1))
+        # one way: the rest of the run keeps the short ladder (admit() has already counted on it)
+        if projected > self.ceiling and not self.trimmed and sum(self.requests.values()) >= self.min_samples:
+            self.trimmed = True
+            logger.warning(f"Budget: projected {projected:.0f} > ceiling {self.ceiling:.0f} credits, "
+                           f"skipping retry stages after {PROFILE_LADDER[self.cutoff]}.")
+
+    # ---- decisions ----
+    def admit(self, profile):
+        """Admit one more URL starting at `profile` if its expected cost still fits."""
+        if self.projected() + self.expected(profile) > self.ceiling:
+            if self.projected(trimmed=True) + self.expected(profile, trimmed=True) > self.ceiling:
+                return False
+        self._move(profile, 1)
+        self._update()
+        return True
+
+    async def wait_admit(self, profile, interval=0.5):
+        """
+        admit(), waiting while URLs are in flight: their results refine the
+        averages and free projected credits. False once nothing is in flight
+        and the URL still does not fit.
+        """
+        while not self.admit(profile):
+            if not any(n > 0 for n in self.pending.values()):
+                return False
+            await asyncio.sleep(interval)
+        return True
+
+    async def allow(self, profile, interval=0.5):
+        """
+        Whether an admitted URL may make its next request (at `profile`). While
+        the request only fits once the ones in flight are billed, it waits.
+        """
+        reason = None
+        if self.trimmed and rank(profile) > self.cutoff:
+            reason = "stage"
+        while reason is None and self.spent + self.reserved + self.cost(profile) > self.ceiling:
+            if not any(n > 0 for n in self.in_flight.values()):
+                if not self.stopped:
+                    logger.warning(f"Budget: {self.spent:.0f} of {self.ceiling:.0f} credits spent - no new requests.")
+                self.stopped, reason = True, "stop"
+            else:
+                await asyncio.sleep(interval)
+        if reason is None:
+            self.in_flight[profile] = self.in_flight.get(profile, 0) + 1
+            return True
+        self.skipped[reason] += 1
+        metrics.BUDGET_SKIPPED.inc(reason=reason)
+        self._move(profile, -1)
+        self._update()
+        return False
+
+    def reject(self, n):
+        """`n` planned URLs not admitted (queue shrunk)."""
+        if n:
+            self.skipped["url"] += n
+            metrics.BUDGET_SKIPPED.inc(n, reason="url")
+            logger.warning(f"Budget: {n} URLs left for the next run (projected {self.projected():.0f} "
+                           f"of {self.ceiling:.0f} credits).")
+
+    def summary(self):
+        return {
+            "ceiling": round(self.ceiling, 1),
+            "spent": round(self.spent, 1),
+            "projected": round(self.projected(), 1),
+            "skipped": dict(self.skipped),
+            "trimmed": self.trimmed,
+            "stopped": self.stopped,
+            "cost_per_request": {p: round(self.cost(p), 1) for p in self.requests},
+        }
+
+def make_governor(shards=1, hedger=None):
+    """
+    Governor capped at GOVERNOR_MAX_CREDITS and (GOVERNOR_USE_ACCOUNT) at the
+    account's remaining credits minus GOVERNOR_RESERVE, split evenly between
+    `shards`. None when there is no ceiling to enforce.
+    """
+    limits = [GOVERNOR_MAX_CREDITS] if GOVERNOR_MAX_CREDITS > 0 else []
+    if GOVERNOR_USE_ACCOUNT:
+        remaining = account_credits()
+        if remaining is not None:
+            limits.append(max(0.0, remaining - GOVERNOR_RESERVE))
+    if not limits:
+        return None
+    ceiling = min(limits) / max(1, shards)
+    logger.info(f"Credit ceiling for this run: {ceiling:.0f}")
+    return CreditGovernor(ceiling, hedger=hedger)
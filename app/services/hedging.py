@@ -0,0 +1,118 @@
+from app.settings.config import HEDGE_PERCENTILE, HEDGE_BUDGET, HEDGE_MIN_SAMPLES
+from app.utils.logger import logger
+from collections import deque
+import asyncio, copy, time, uuid
+
+# ──────────────────────────────────────────────────────────────────────────────
+# HELPERS
+# ──────────────────────────────────────────────────────────────────────────────
+def _cost(res):
+    value = getattr(getattr(res, "response", None), "headers", {}).get("X-Scrapfly-Api-Cost")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CORE
+# ──────────────────────────────────────────────────────────────────────────────
+class Hedger:
+    """
+    Hedged Scrapfly requests: when a request is still running after the
+    `percentile` of the latencies seen for its profile, a second request with
+    a fresh session is fired and whichever answers first wins.
+
+    The loser is not stopped: async_scrape runs in a client thread that keeps
+    going after its task is cancelled, finishes, and is billed. So a hedge
+    only fires when the limiter has a free slot right now, and that slot is
+    held until both requests are done. At most `budget` hedges are fired per
+    run; their credits are tracked in `extra_credits` (estimated from the
+    winner until the loser finishes, then its real cost).
+    """
+
+    def __init__(self, percentile=HEDGE_PERCENTILE, budget=HEDGE_BUDGET,
+                 min_samples=HEDGE_MIN_SAMPLES, window=500):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.window = window
+        self.samples = {}  # {profile: recent latencies} - fast and rendered differ by far
+        self.fired = 0
+        self.won = 0
+        self.losers_running = 0
+        self.extra_credits = 0.0
+
+    def _window(self, profile):
+        return self.samples.setdefault(profile, deque(maxlen=self.window))
+
+    def threshold(self, profile=None):
+        """Latency (s) after which a `profile` request gets hedged, None while warming up."""
+        samples = self._window(profile)
+        if len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+
+    async def scrape(self, client, cfg, limiter=None, profile=None):
+        started = time.monotonic()
+        primary = asyncio.ensure_future(client.async_scrape(cfg))
+        delay = self.threshold(profile)
+        try:
+            if delay is not None and self.fired < self.budget:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                # the slot is taken when the hedge fires: requests that waited together
+                # must not all pass the budget check made before the wait
+                if not done and self.fired < self.budget and (limiter is None or limiter.try_acquire()):
+                    self.fired += 1
+                    return await self._race(client, cfg, primary, started, limiter, profile)
+            res = await primary
+        except asyncio.CancelledError:
+            await _cancel([primary])
+            raise
+        self._window(profile).append(time.monotonic() - started)
+        return res
+
+    async def _race(self, client, cfg, primary, started, limiter, profile):
+        hedge_cfg = copy.copy(cfg)
+        hedge_cfg.session = f"HEDGE-{uuid.uuid4()}"
+        hedge = asyncio.ensure_future(client.async_scrape(hedge_cfg))
+        logger.info(f"Hedging slow {profile or ''} request ({self.fired}/{self.budget})..")
+        # the extra slot is released once both requests are over, not when one wins
+        both = asyncio.gather(primary, hedge, return_exceptions=True)
+        if limiter is not None:
+            both.add_done_callback(lambda _: limiter.release())
+
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                res = task.result()
+                self.won += task is hedge
+                estimate = _cost(res)  # the loser is billed about the same
+                self.extra_credits += estimate
+                self._window(profile).append(time.monotonic() - started)
+                if pending:
+                    self.losers_running += 1
+                    loser = next(iter(pending))
+                    loser.add_done_callback(lambda t, estimate=estimate: self._loser_done(t, estimate))
+                return res
+        raise error
+
+    def _loser_done(self, task, estimate):
+        self.losers_running -= 1
+        cost = 0.0 if task.cancelled() or task.exception() is not None else _cost(task.result())
+        self.extra_credits += cost - estimate
+
+    def summary(self):
+        return {
+            "fired": self.fired, "won": self.won, "losers_running": self.losers_running,
+            "extra_credits": self.extra_credits,
+        }
@@ -0,0 +1,126 @@
+from app.settings.config import JOB_MAX_WORKERS, JOB_QUEUE_SIZE
+from app.services.checkpoint import new_run_id
+from app.utils.logger import logger
+from concurrent.futures import ThreadPoolExecutor
+import threading, time
+
+# ──────────────────────────────────────────────────────────────────────────────
+# JOB (also the progress handle the pipeline reports into)
+# ──────────────────────────────────────────────────────────────────────────────
+class Job:
+    def __init__(self, job_id=None):
+        self.id = job_id or new_run_id()
+        self.run_id = self.id
+        self.status = "queued"  # queued | running | finished | failed | cancelled
+        self.stage = None
+        self.done = 0
+        self.failed = 0
+        self.error = None
+        self.summary = None  # per-run metrics summary, set when the run ends
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    # ---- progress hooks (called from the pipeline) ----
+    def set_stage(self, stage):
+        logger.info(f"[job {self.id}] stage: {stage}")
+        self.stage = stage
+
+    def count(self, status):
+        with self._lock:
+            if status in ("successed", "discarded"):
+                self.done += 1
+            else:
+                self.failed += 1
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "run_id": self.run_id,
+            "status": self.status,
+            "stage": self.stage,
+            "done": self.done,
+            "failed": self.failed,
+            "elapsed_s": round(end - self.started_at, 1) if self.started_at else 0.0,
+            "cancel_requested": self.cancelled,
+            "error": self.error,
+            "summary": self.summary,
+        }
+
+# ──────────────────────────────────────────────────────────────────────────────
+# MANAGER
+# ──────────────────────────────────────────────────────────────────────────────
+class JobManager:
+    """
+    Runs scraping jobs on a bounded executor. With queue_size=0 it is
+    single-flight: a trigger while a job is active is rejected; otherwise up to
+    `queue_size` jobs wait for a free worker.
+    """
+
+    def __init__(self, max_workers=JOB_MAX_WORKERS, queue_size=JOB_QUEUE_SIZE, history=50):
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.history = history
+        self.jobs = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+
+    def active(self):
+        return [job for job in self.jobs.values() if job.active]
+
+    def submit(self, fn, job_id=None, **kwargs):
+        """
+        Queue `fn(progress=job, **kwargs)`. Returns (job, accepted); when
+        rejected, `job` is the active job that blocked it.
+        """
+        with self._lock:
+            active = self.active()
+            if len(active) >= self.max_workers + self.queue_size:
+                return active[0], False
+            job = Job(job_id)
+            self.jobs[job.id] = job
+            self._trim()
+        self._executor.submit(self._run, job, fn, kwargs)
+        return job, True
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None and job.active:
+            job.cancel()
+        return job
+
+    def _run(self, job, fn, kwargs):
+        if job.cancelled:
+            job.status, job.finished_at = "cancelled", time.time()
+            return
+        job.status, job.started_at = "running", time.time()
+        try:
+            fn(progress=job, **kwargs)
+            job.status = "cancelled" if job.cancelled else "finished"
+        except Exception as e:
+            logger.exception(f"[job {job.id}] failed")
+            job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+        finally:
+            job.finished_at = time.time()
+
+    def _trim(self):
+        finished = [j for j in self.jobs.values() if not j.active]
+        for job in sorted(finished, key=lambda j: j.created_at)[:max(0, len(self.jobs) - self.history)]:
+            del self.jobs[job.id]
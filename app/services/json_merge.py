@@ -1,6 +1,7 @@
 from app.utils.logger import logger
-from app.database.db_manager import load_scrap
-import pandas as pd
+from app.database.db_manager import load_scrap, load_offers, get_urls
+from app.services.canonical import group_links
+from app.services import metrics
 import json
 import os
 
@@ -28,60 +29,94 @@ def load_json_list(path):
     else:
         return []
 
-def safe_numeric(series):
-    """Convert a series to numeric, coerce errors to 0."""
-    return pd.to_numeric(series, errors="coerce").fillna(0)
+def cost_value(value):
+    """Numeric Scrapfly cost of one attempt ("n/a" and garbage count as 0)."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def clean_price(value):
+    """'12.345' -> 12345, empty / missing -> 0."""
+    digits = str(value or "").replace(".", "")
+    return int(digits) if digits.isdigit() else 0
+
+def db_row(last, cost_total):
+    """
+    Map the winning attempt of a URL to the scrapped_competence columns
+    (plus "offers" for scrape_offers when the attempt carries seller offers).
+    """
+    row = {
+        "catalog_link": last["_url"],
+        "title": last.get("title"),
+        "price": clean_price(last.get("price")),
+        "competitor": last.get("competitor"),
+        "price_in_installments": 0 if last.get("price_in_installments") == "n/a" else last.get("price_in_installments"),
+        "image": last.get("image"),
+        "timestamp": last.get("_timestamp"),
+        "status": last.get("_status"),
+        "api_cost_total": cost_total,
+    }
+    if "_offers" in last:
+        row["offers"] = [{**offer, "price": clean_price(offer.get("price"))} for offer in last["_offers"]]
+    return row
 
 # ──────────────────────────────────────────────────────────────
-# CORE: build merged union with last record + sum of api cost
+# CORE: single-pass reducer (last record + sum of api cost)
 # ──────────────────────────────────────────────────────────────
-def merge_scraping():
-
-    # 1. Load JSONs
-    scrap_rows  = load_json_list(SCRAP_RESULTS_PATH)
-    failed_rows = load_json_list(FAILED_SCRAP_PATH)
-
-    # 2. Convert to DataFrame
-    df_scrap  = pd.DataFrame(scrap_rows)
-    df_failed = pd.DataFrame(failed_rows)
+class ScrapReducer:
+    """
+    Streaming reducer over attempt rows: keeps one small record per URL
+    (latest row + running cost total), so memory grows with unique URLs and
+    not with the number of retry attempts.
+    """
+
+    def __init__(self):
+        self._last = {}
+        self._cost = {}
+
+    def add(self, row):
+        url = row["_url"]
+        self._cost[url] = self._cost.get(url, 0.0) + cost_value(row.get("_api_cost"))
+        current = self._last.get(url)
+        # ">=": on equal timestamps the attempt seen later wins
+        if current is None or row.get("_timestamp", "") >= current.get("_timestamp", ""):
+            self._last[url] = row
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+        return self
+
+    def __len__(self):
+        return len(self._last)
+
+    def rows(self):
+        """DB rows, price already cleaned."""
+        for url, last in self._last.items():
+            yield db_row(last, self._cost[url])
+
+def finalize_url(rows):
+    """
+    Collapse every attempt of one URL (first pass + retries) into its DB row:
+    the latest attempt wins, api costs are summed.
+    """
+    return next(ScrapReducer().extend(rows).rows())
 
-    # If failed_rows is empty, just work with scrap_rows
-    if df_failed.empty:
-        df_all = df_scrap.copy()
-    else:
-        # Combine both sources
-        df_all = pd.concat([df_scrap, df_failed], ignore_index=True)
+def merge_scraping():
+    reducer = ScrapReducer()
+    for path in (SCRAP_RESULTS_PATH, FAILED_SCRAP_PATH):
+        reducer.extend(load_json_list(path))
 
-    if df_all.empty:
+    if not len(reducer):
         logger.info("No data to process.")
         return
 
-    # 3.Sort Values by scrapped timestamp
-    df_all = df_all.sort_values("_timestamp")
-
-    # 4. Safe cast _api_cost to numeric
-    df_all["_api_cost"] = safe_numeric(df_all.get("_api_cost", 0))
-
-    # 5. Group by _url, keep last record per URL, sum _api_cost
-    last_records = df_all.groupby("_url").last().reset_index()
-    sum_costs = df_all.groupby("_url")["_api_cost"].sum().reset_index().rename(columns={"_api_cost": "_api_cost_total"})
-
-    # 6. Merge last record with sum of api cost
-    merged_df = pd.merge(last_records, sum_costs, on="_url")
-
-    column_mapping = {
-        "_url": "catalog_link",
-        "_timestamp": "timestamp",
-        "_status": "status",
-        "_api_cost_total": "api_cost_total"
-    }
-    merged_df = merged_df.rename(columns=column_mapping)
-
-    print(merged_df)
-
-    merged_df['price'] = merged_df['price'].apply(lambda x: 0 if x == '' else int(x.replace('.', '')))
-    merged_df['price_in_installments'] = merged_df['price_in_installments'].apply(lambda x: 0 if x == 'n/a' else x)
-
-    print(merged_df)
-
-    load_scrap(merged_df.to_dict(orient="records"))
\ No newline at end of file
+    logger.info(f"Merged {len(reducer)} URLs.")
+    rows = list(reducer.rows())
+    for row in rows:
+        metrics.URL_CREDITS.observe(row["api_cost_total"], status=row["status"])
+    # scrap_meli_urls scraped each product once: write it back to every original link
+    aliases = group_links(get_urls())
+    load_scrap(rows, aliases=aliases)
+    load_offers(rows, aliases=aliases)
@@ -0,0 +1,199 @@
+from app.settings.config import METRICS_DIR
+from app.utils.logger import logger
+from contextlib import contextmanager
+import asyncio, bisect, json, os, threading, time
+
+# ──────────────────────────────────────────────────────────────────────────────
+# METRIC TYPES (Prometheus text format, no client library needed)
+# ──────────────────────────────────────────────────────────────────────────────
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120)
+PARSE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+CREDIT_BUCKETS = (1, 5, 10, 25, 30, 50, 75, 100, 150, 200, 300)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _fmt(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        return self.header() + [f"{self.name}{self._fmt(k)} {v}" for k, v in sorted(self.snapshot().items())]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self.values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self.values.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = self.header()
+        for key, (counts, total, count) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{self._fmt(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._fmt(key)} {total}")
+            lines.append(f"{self.name}_count{self._fmt(key)} {count}")
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self.values.items()}
+
+    def quantile(self, counts, q):
+        """Upper bound of the bucket holding the q-quantile (None above the last bucket)."""
+        target, cumulative = q * sum(counts), 0
+        for bound, n in zip(self.buckets + (None,), counts):
+            cumulative += n
+            if n and cumulative >= target:
+                return bound
+        return None
+
+REGISTRY = []
+
+# ──────────────────────────────────────────────────────────────────────────────
+# HOT-PATH METRICS
+# ──────────────────────────────────────────────────────────────────────────────
+REQUEST_SECONDS = Histogram(
+    "scrap_request_seconds", "Scrapfly request latency", ("profile", "outcome"), LATENCY_BUCKETS)
+CREDITS = Counter("scrap_credits_total", "Scrapfly credits billed (X-Scrapfly-Api-Cost)", ("profile",))
+PARSE_SECONDS = Histogram(
+    "scrap_parse_seconds", "HTML parse time, including the wait for a parse worker", ("profile",), PARSE_BUCKETS)
+RESULTS = Counter("scrap_results_total", "Parsed attempts per stage and status", ("stage", "status"))
+URL_CREDITS = Histogram("scrap_url_credits", "Credits spent per finished URL (all attempts)", ("status",), CREDIT_BUCKETS)
+DB_LOAD_SECONDS = Histogram("scrap_db_load_seconds", "load_scrap time per chunk", (), LATENCY_BUCKETS)
+DB_ROWS = Counter("scrap_db_rows_total", "Rows written to scrapped_competence", ("status",))
+DB_UNCHANGED = Counter("scrap_db_unchanged_total", "Scraped rows not written because nothing changed")
+PRICE_CHANGES = Counter("scrap_price_changes_total", "Price/competitor changes appended to scrape_price_history")
+QUEUE_DEPTH = Gauge("scrap_queue_depth", "Items waiting in a pipeline queue", ("queue",))
+CONCURRENCY = Gauge("scrap_concurrency_limit", "Current adaptive concurrency limit")
+CREDITS_PROJECTED = Gauge("scrap_credits_projected", "Credits the run is projected to spend (governor)")
+BUDGET_SKIPPED = Counter("scrap_budget_skipped_total", "Requests not made to stay within the credit ceiling", ("reason",))
+DEDUP_SAVED = Counter("scrap_dedup_saved_total", "Requests avoided by scraping duplicate product links once")
+
+def outcome(exc):
+    """Short label for a failed request: 'ERR::ASP::...' -> 'ASP', else the exception type."""
+    parts = str(getattr(exc, "code", "") or "").split("::")
+    return parts[1] if len(parts) > 1 else type(exc).__name__
+
+def render():
+    """Every metric in the Prometheus text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+def snapshot():
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+# ──────────────────────────────────────────────────────────────────────────────
+# PER-RUN SUMMARY
+# ──────────────────────────────────────────────────────────────────────────────
+def _label_str(metric, key):
+    return ",".join(f"{k}={v}" for k, v in zip(metric.labels, key)) or "all"
+
+def run_summary(before):
+    """What happened since `before` (a snapshot()): counter deltas and histogram count/mean/p50/p95."""
+    summary = {}
+    for metric in REGISTRY:
+        previous, current, series = before.get(metric.name, {}), metric.snapshot(), {}
+        for key, value in current.items():
+            if isinstance(metric, Histogram):
+                old_counts, old_total, old_count = previous.get(key) or ([0] * len(value[0]), 0.0, 0)
+                counts = [n - o for n, o in zip(value[0], old_counts)]
+                count, total = value[2] - old_count, value[1] - old_total
+                if count:
+                    series[_label_str(metric, key)] = {
+                        "count": count,
+                        "sum": round(total, 3),
+                        "mean": round(total / count, 4),
+                        "p50": metric.quantile(counts, 0.50),
+                        "p95": metric.quantile(counts, 0.95),
+                    }
+            elif isinstance(metric, Gauge):
+                series[_label_str(metric, key)] = value
+            elif value - previous.get(key, 0):
+                series[_label_str(metric, key)] = value - previous.get(key, 0)
+        if series:
+            summary[metric.name] = series
+    return summary
+
+def dump_run_summary(run_id, before, extra=None, directory=METRICS_DIR):
+    """Write the run's summary to `<directory>/<run_id>.json` and return it."""
+    summary = {"run_id": run_id, **(extra or {}), "metrics": run_summary(before)}
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{run_id}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        logger.info(f"Run summary written to {path}")
+    except OSError as e:
+        logger.error(f"Could not write run summary: {e}")
+    return summary
+
+async def sample_queues(queues, limiter, stats, interval=1.0):
+    """Publish queue depths / concurrency every `interval` seconds; keeps the max depth in `stats`."""
+    try:
+        while True:
+            for name, queue in queues.items():
+                depth = queue.qsize()
+                QUEUE_DEPTH.set(depth, queue=name)
+                stats[name] = max(stats.get(name, 0), depth)
+            CONCURRENCY.set(int(limiter.limit))
+            await asyncio.sleep(interval)
+    except asyncio.CancelledError:
+        for name in queues:
+            QUEUE_DEPTH.set(0, queue=name)
+        raise
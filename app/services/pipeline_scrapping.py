@@ -1,13 +1,314 @@
-from app.services.first_scrapp import scrap_meli_urls   
-from app.services.second_scrapp import scrap_urls_failed    
-from app.services.json_merge import merge_scraping
+from app.services.first_scrapp import scrape_one, make_parse_pool
+from app.services.second_scrapp import retry_ladder, DONE_STATUSES
+from app.services.json_merge import finalize_url
+from app.services.concurrency import make_limiter, size_client_pool
 from app.services.budget import remain_budget
 from app.services.notification import enviar_mensaje_whapi
+from app.services.extractor import DISCARD_PHRASE
+from app.services.checkpoint import open_checkpoint
+from app.services.planner import plan, next_states, product_states, per_product, load_weights
+from app.services.profile_memory import ProfileMemory, FIRST_PASS_PROFILES
+from app.services.hedging import Hedger
+from app.services.governor import make_governor
+from app.services.sharding import ShardSpec, default_run_id, mark_shard, shard_report, claim_notification
+from app.services.jobs import Job
+from app.services import metrics
+from app.services.archive import open_archive
+from app.services.canonical import canonical_key, group_links, expand
+from app.database.db_manager import (
+    get_link_states, save_link_states, load_scrap, load_offers, warm_pool, StateIndex, get_price_volatility,
+)
+from app.settings.config import (
+    SCRAP_KEY, PIPELINE_QUEUE_SIZE, PIPELINE_SINK_BATCH, DB_PREWARM, DB_CHANGE_ONLY, HEDGE_ENABLED, SHARD_INDEX,
+    SHARD_COUNT, SHARD_EXECUTION, SCRAP_FAST_PATH, PLAN_MAX_CREDITS, PLAN_MAX_URLS, PLAN_VOLATILITY_DAYS,
+    PLAN_DEADLINE_MINUTES,
+)
+from app.utils.logger import logger
+from scrapfly import ScrapflyClient
+import asyncio, threading, time
 
-def scrapping():
-    enviar_mensaje_whapi("comenzando scrapping")
-    scrap_meli_urls()
-    scrap_urls_failed()
+# ──────────────────────────────────────────────────────────────────────────────
+# STREAMING PIPELINE
+#   fetch (first pass) ─┬─> reduce ─> db sink
+#                       └─> retry ladder ─┘
+# Stages are connected by bounded queues; None is the end-of-stream marker.
+# Checkpoint records: {"row": <db row>} once a URL is reduced,
+# {"loaded": [catalog_link, ...]} once a batch is in the database.
+# ──────────────────────────────────────────────────────────────────────────────
+def resume_state(checkpoint):
+    """(links already handled, reduced rows that never reached the database)."""
+    rows, loaded = {}, set()
+    for record in checkpoint.records():
+        if "row" in record:
+            rows[record["row"]["catalog_link"]] = record["row"]
+        loaded.update(record.get("loaded", []))
+    pending = [row for link, row in rows.items() if link not in loaded]
+    return set(rows), pending
+
+def first_profile(memory, url):
+    """Profile of the first request `url` will make this run."""
+    profile = memory.start_for(url)
+    return "rendered" if profile == "fast" and not SCRAP_FAST_PATH else profile
+
+def expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+async def _fetch_worker(client, limiter, parse_pool, memory, hedger, archive, progress, governor, deadline,
+                        url_q, retry_q, reduce_q):
+    while (url := await url_q.get()) is not None:
+        if progress.cancelled or expired(deadline):
+            continue
+        profile = memory.start_for(url)
+        if profile not in FIRST_PASS_PROFILES:
+            # known hard URL: straight to the ladder stage that worked last time
+            await retry_q.put((None, url, profile))
+            continue
+        if governor is not None and not await governor.allow(first_profile(memory, url)):
+            continue
+        async with limiter:
+            row = await scrape_one(client, url, DISCARD_PHRASE, parse_pool, limiter, profile, hedger, archive, governor)
+        if row["_status"] in DONE_STATUSES:
+            await reduce_q.put([row])
+        else:
+            await retry_q.put((row, url, None))
+
+async def _retry_worker(client, limiter, parse_pool, archive, progress, governor, deadline, retry_q, reduce_q):
+    while (item := await retry_q.get()) is not None:
+        first, url, start_stage = item
+        if progress.cancelled or expired(deadline):
+            if first:
+                await reduce_q.put([first])  # keep what was already paid for
+            continue
+        attempts = await retry_ladder(client, url, limiter, parse_pool, start_stage, archive, governor)
+        if first or attempts:  # nothing to load when the governor skipped the whole ladder
+            await reduce_q.put(([first] if first else []) + attempts)
+
+async def _reducer(reduce_q, db_q, checkpoint, pending_rows, memory):
+    for row in pending_rows:
+        await db_q.put(row)
+    while (rows := await reduce_q.get()) is not None:
+        memory.observe(rows)
+        row = finalize_url(rows)
+        metrics.URL_CREDITS.observe(row["api_cost_total"], status=row["status"])
+        if checkpoint is not None:
+            checkpoint.append({"row": row})
+        await db_q.put(row)
+    await db_q.put(None)
+
+async def _db_sink(db_q, batch_size, stats, checkpoint, after_load, progress, aliases, index):
+    batch = []
+    while True:
+        row = await db_q.get()
+        if row is not None:
+            batch.append(row)
+            stats[row["status"]] = stats.get(row["status"], 0) + 1
+            progress.count(row["status"])
+        if batch and (row is None or len(batch) >= batch_size):
+            await asyncio.to_thread(load_scrap, batch, aliases=aliases, index=index)
+            await asyncio.to_thread(load_offers, batch, aliases=aliases)
+            if after_load is not None:
+                await asyncio.to_thread(after_load, batch)
+            if checkpoint is not None:
+                checkpoint.append({"loaded": [r["catalog_link"] for r in batch]})
+            batch = []
+        if row is None:
+            return
+
+async def run_pipeline(urls, queue_size=PIPELINE_QUEUE_SIZE, batch_size=PIPELINE_SINK_BATCH,
+                       checkpoint=None, pending_rows=(), after_load=None, memory=None, progress=None, archive=None,
+                       aliases=None, index=None, governor=None, deadline=None):
+    """
+    Scrape `urls` end to end: failures enter the retry ladder as soon as the
+    first pass gives up on them and finished rows stream to the database.
+    `pending_rows` are already reduced rows (from a resumed run) to load first;
+    `after_load(batch)` runs (in a thread) after every batch reaches the database.
+    `memory` (ProfileMemory) picks each URL's starting profile and learns from the attempts.
+    `progress` (jobs.Job) receives per-row counts; once cancelled, no new request is started
+    and the rows already scraped are still loaded.
+    `archive` (archive.PageArchive) keeps the raw HTML for offline re-parsing.
+    `aliases` (canonical.group_links) fans every row out to all original links of its product.
+    `index` (db_manager.StateIndex) limits the writes to rows that changed.
+    `governor` (governor.CreditGovernor) admits URLs and requests while they fit the credit ceiling;
+    URLs it turns away are not written, so the planner keeps them due.
+    `deadline` (time.monotonic()) ends a partial run: no URL or retry ladder starts after it,
+    requests in flight finish and are loaded.
+    Returns the count of rows written per status (plus the max depth seen per queue).
+    """
+    limiter = make_limiter()
+    hedger = Hedger() if HEDGE_ENABLED else None
+    client = size_client_pool(ScrapflyClient(key=SCRAP_KEY), limiter)
+    parse_pool = make_parse_pool()
+    workers = limiter.ceiling  # the limiter decides how many actually run
+    memory = memory or ProfileMemory()
+    progress = progress or Job()
+    if governor is not None:
+        governor.hedger = hedger
+
+    url_q = asyncio.Queue(maxsize=queue_size)
+    retry_q = asyncio.Queue(maxsize=queue_size)
+    reduce_q = asyncio.Queue(maxsize=queue_size)
+    db_q = asyncio.Queue(maxsize=queue_size)
+    stats = {}
+
+    async def feed():
+        for position, url in enumerate(urls):
+            if progress.cancelled:
+                logger.warning("Run cancelled - no new URLs will be scheduled.")
+                break
+            if expired(deadline):
+                logger.warning(f"Deadline reached - {len(urls) - position} URLs left for the next run.")
+                break
+            # admitted when it reaches the queue, so the projection has seen the URLs before it
+            if governor is not None and not await governor.wait_admit(first_profile(memory, url)):
+                governor.reject(len(urls) - position)
+                break
+            await url_q.put(url)
+        for _ in range(workers):
+            await url_q.put(None)
+
+    async def first_pass():
+        await asyncio.gather(*(
+            _fetch_worker(client, limiter, parse_pool, memory, hedger, archive, progress, governor, deadline,
+                          url_q, retry_q, reduce_q)
+            for _ in range(workers)
+        ))
+        for _ in range(workers):
+            await retry_q.put(None)
+
+    async def second_pass():
+        await asyncio.gather(*(
+            _retry_worker(client, limiter, parse_pool, archive, progress, governor, deadline, retry_q, reduce_q)
+            for _ in range(workers)
+        ))
+        await reduce_q.put(None)
+
+    depths = {}
+    sampler = asyncio.create_task(metrics.sample_queues(
+        {"url": url_q, "retry": retry_q, "reduce": reduce_q, "db": db_q}, limiter, depths,
+    ))
+    try:
+        await asyncio.gather(
+            feed(),
+            first_pass(),
+            second_pass(),
+            _reducer(reduce_q, db_q, checkpoint, pending_rows, memory),
+            _db_sink(db_q, batch_size, stats, checkpoint, after_load, progress, aliases, index),
+        )
+    finally:
+        sampler.cancel()
+        await asyncio.gather(sampler, return_exceptions=True)
+        parse_pool.shutdown(wait=True)
+        client.async_executor.shutdown(wait=False)
+    if expired(deadline):
+        scraped = sum(n for n in stats.values() if isinstance(n, int))
+        logger.warning(f"Partial run: deadline reached after {scraped} of {len(urls)} URLs.")
+        stats["deadline_reached"] = True
+    stats["queue_depth_max"] = depths
+    if hedger is not None:
+        logger.info(f"Hedging: {hedger.summary()}")
+        stats["hedge_extra_credits"] = hedger.extra_credits
+    if governor is not None:
+        logger.info(f"Credit governor: {governor.summary()}")
+        stats["budget"] = governor.summary()
+    return stats
+
+# ──────────────────────────────────────────────────────────────────────────────
+# MAIN
+# ──────────────────────────────────────────────────────────────────────────────
+def scrapping(run_id=None, resume=False, shard=None, progress=None, top_n=None, deadline_minutes=None):
+    """
+    Full run. With a ShardSpec (index/count) this instance only scrapes its
+    share of the links; shards of one run must share `run_id` (default: the
+    Cloud Run job execution), and the last shard to finish sends the closing
+    notification.
+    `progress` is the jobs.Job tracking (and possibly cancelling) this run.
+    Partial run: only the `top_n` highest priority links (default PLAN_MAX_URLS),
+    and no new URL after `deadline_minutes` (default PLAN_DEADLINE_MINUTES).
+    """
+    shard = shard or ShardSpec(SHARD_INDEX, SHARD_COUNT)
+    before, started = metrics.snapshot(), time.monotonic()
+    if shard.enabled:
+        run_id = run_id or default_run_id()
+        if not run_id:
+            raise ValueError("A sharded run needs a run_id (from the trigger or CLOUD_RUN_EXECUTION)")
+    elif progress is not None and not run_id and not resume:
+        run_id = progress.id  # job ID doubles as run ID
+    progress = progress or Job(run_id)
+    if DB_PREWARM:
+        # connector setup + cert refresh overlaps with the notification
+        warm = threading.Thread(target=warm_pool, daemon=True)
+        warm.start()
+    if shard.index == 0:
+        enviar_mensaje_whapi("comenzando scrapping")
+    if DB_PREWARM:
+        warm.join()
+    logger.info(f"START - Streaming pipeline (shard {shard}).")
+    progress.set_stage("planning")
+    checkpoint = open_checkpoint(f"pipeline{shard.suffix()}", run_id, resume)
+    progress.run_id = checkpoint.run_id
+    handled, pending_rows = resume_state(checkpoint)
+    # shard by product, so duplicate links of one product land in the same shard
+    states = shard.select(get_link_states(), key=lambda state: canonical_key(state["catalog_link"]))
+    states_by_link = {state["catalog_link"]: state for state in states}
+    aliases = group_links(states_by_link)
+    # the credit ceiling (account budget read before the run) also caps the plan's estimate
+    governor = make_governor(shard.count)
+    caps = [c for c in (PLAN_MAX_CREDITS, governor.ceiling if governor else 0) if c > 0]
+    # one state per product before the caps: duplicate links would use up top_n slots and credits
+    planned = plan(
+        product_states(states, aliases), max_urls=top_n or PLAN_MAX_URLS, max_credits=min(caps, default=0),
+        volatility=per_product(get_price_volatility(PLAN_VOLATILITY_DAYS), aliases),
+        weights=per_product(load_weights(), aliases),
+    )
+    urls = [u for u in planned if u not in handled]
+    if handled:
+        logger.info(f"Resuming: {len(handled)} URLs already finished ({len(pending_rows)} to load), {len(urls)} left.")
+    if shard.enabled:
+        mark_shard(checkpoint.run_id, shard, "running", len(urls))
+
+    memory = ProfileMemory.load()
+    index = StateIndex.load() if DB_CHANGE_ONLY else None
+
+    def after_load(batch):
+        save_link_states(next_states(list(expand(batch, aliases)), states_by_link))
+        memory.flush()
+
+    progress.set_stage("scraping")
+    deadline_minutes = deadline_minutes or PLAN_DEADLINE_MINUTES
+    deadline = time.monotonic() + deadline_minutes * 60 if deadline_minutes else None
+    archive = open_archive(f"{checkpoint.run_id}{shard.suffix()}")
+    stats = asyncio.run(run_pipeline(
+        urls, checkpoint=checkpoint, pending_rows=pending_rows, after_load=after_load, memory=memory,
+        progress=progress, archive=archive, aliases=aliases, index=index, governor=governor, deadline=deadline,
+    ))
+    if archive is not None:
+        archive.close()
+    logger.info(f"END - Streaming pipeline {checkpoint.run_id}. Rows per status: {stats}")
+
+    def summarize(status, **extra):
+        progress.summary = metrics.dump_run_summary(f"{checkpoint.run_id}{shard.suffix()}", before, {
+            "status": status,
+            "shard": str(shard),
+            "urls": len(urls),
+            "elapsed_s": round(time.monotonic() - started, 1),
+            "rows": stats,
+            **extra,
+        })
+
+    if progress.cancelled:
+        if shard.enabled:
+            mark_shard(checkpoint.run_id, shard, "cancelled", len(urls))
+        summarize("cancelled")
+        logger.warning(f"Run {checkpoint.run_id} cancelled - resume it with resume=True.")
+        return
+    progress.set_stage("notifying")
+    if shard.enabled:
+        mark_shard(checkpoint.run_id, shard, "finished", len(urls))
+        # every shard that sees the run done competes for the message: one claims it
+        done = shard_report(checkpoint.run_id, shard.count, SHARD_EXECUTION)["done"]
+        if not done or not claim_notification(checkpoint.run_id, shard):
+            summarize("finished")
+            return
     budget_data, credist_left = remain_budget()
-    merge_scraping()
-    enviar_mensaje_whapi(budget_data)
\ No newline at end of file
+    summarize("finished", credits_left=credist_left)
+    enviar_mensaje_whapi(budget_data)
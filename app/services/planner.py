@@ -0,0 +1,163 @@
+from app.utils.logger import logger
+from app.services.canonical import normalize_url
+from app.services import metrics
+from app.settings.config import (
+    PLAN_TTL_HOURS, PLAN_TTL_FILE, PLAN_DISCARD_BACKOFF_HOURS, PLAN_DISCARD_MAX_HOURS,
+    PLAN_MAX_URLS, PLAN_MAX_CREDITS, PLAN_DEFAULT_COST, PLAN_WEIGHT_FILE, PLAN_VOLATILITY_PRIOR, PLAN_NEVER_AGE_HOURS,
+)
+from datetime import datetime, timedelta
+import heapq, json, os
+
+# ──────────────────────────────────────────────────────────────────────────────
+# HELPERS
+# ──────────────────────────────────────────────────────────────────────────────
+RETRY_ALWAYS = ("failed", "SCRAPFLY ERROR", "UNEXPECTED ERROR")
+
+def _load_link_floats(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return {link: float(value) for link, value in json.load(f).items()}
+
+def load_ttl_overrides(path=PLAN_TTL_FILE):
+    """Per-link TTLs in hours ({catalog_link: hours}) from PLAN_TTL_FILE."""
+    return _load_link_floats(path)
+
+def load_weights(path=PLAN_WEIGHT_FILE):
+    """Per-link business weights ({catalog_link: weight}, default 1) from PLAN_WEIGHT_FILE."""
+    return _load_link_floats(path)
+
+def parse_ts(value):
+    """DB timestamps come back as datetime (MySQL) or ISO strings (SQLite / JSON)."""
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+def estimated_cost(state):
+    cost = state.get("api_cost_total")
+    return float(cost) if cost else PLAN_DEFAULT_COST
+
+def ttl_for(state, overrides):
+    """How long a link's last result stays fresh."""
+    if state.get("status") == "discarded":
+        streak = max(1, int(state.get("discard_streak") or 0))
+        return timedelta(hours=min(PLAN_DISCARD_BACKOFF_HOURS * 2 ** (streak - 1), PLAN_DISCARD_MAX_HOURS))
+    return timedelta(hours=overrides.get(state["catalog_link"], PLAN_TTL_HOURS))
+
+def priority(state, now, volatility, weights):
+    """
+    Expected price moves missed so far, times the link's business weight:
+    weight * (price changes per day + PLAN_VOLATILITY_PRIOR) * days since the
+    last scrape. Failed links age from their last successful scrape (a failure
+    read no price), and links never read count as PLAN_NEVER_AGE_HOURS old.
+    """
+    last = parse_ts(state.get("timestamp"))
+    if state.get("status") in RETRY_ALWAYS:
+        last = parse_ts(state.get("last_success"))
+    hours = PLAN_NEVER_AGE_HOURS if last is None else max(0.0, (now - last).total_seconds() / 3600)
+    rate = volatility.get(state["catalog_link"], 0.0) + PLAN_VOLATILITY_PRIOR
+    return weights.get(state["catalog_link"], 1.0) * rate * hours / 24
+
+def _staleness(state):
+    """Sort key: links that are always due first, then the oldest scrape."""
+    last = parse_ts(state.get("timestamp"))
+    urgent = last is None or state.get("status") in RETRY_ALWAYS
+    return (not urgent, last or datetime.min)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CORE
+# ──────────────────────────────────────────────────────────────────────────────
+def product_states(states, aliases):
+    """
+    One planner state per product, keyed by its canonical URL (`aliases` is
+    canonical.group_links over the links): the most due of its links' states.
+    Planning on these keeps duplicate links of one product from taking
+    several plan slots and being costed several times.
+    """
+    canonical_of = {raw: url for url, raws in aliases.items() for raw in raws}
+    by_product = {}
+    for state in states:
+        url = canonical_of.get(state["catalog_link"]) or normalize_url(state["catalog_link"])
+        kept = by_product.get(url)
+        if kept is None or _staleness(state) < _staleness(kept):
+            by_product[url] = {**state, "catalog_link": url}
+    saved = len(states) - len(by_product)
+    if saved:
+        metrics.DEDUP_SAVED.inc(saved)
+    logger.info(f"Dedup: {len(states)} links -> {len(by_product)} products ({saved} requests saved).")
+    return list(by_product.values())
+
+def per_product(values, aliases):
+    """{canonical URL: highest value of its links} added to a {link: value} map (weights, volatility)."""
+    out = dict(values)
+    for url, raws in aliases.items():
+        found = [values[raw] for raw in raws if raw in values]
+        if found:
+            out[url] = max(found)
+    return out
+
+def plan(states, now=None, overrides=None, max_urls=PLAN_MAX_URLS, max_credits=PLAN_MAX_CREDITS,
+         volatility=None, weights=None):
+    """
+    Choose which links to scrape this run, most valuable first.
+    - never scraped and failed links are always due;
+    - successful links are due once older than their TTL;
+    - repeatedly discarded links back off exponentially.
+    Due links go through a max-heap on priority() (`volatility`: {link: price
+    changes per day}, `weights`: {link: business weight}) and are popped until
+    `max_urls` links / `max_credits` estimated credits (0 = no cap), so a
+    partial run ("top N") scrapes the links whose prices move the most.
+    """
+    now = now or datetime.now()
+    overrides = load_ttl_overrides() if overrides is None else overrides
+    volatility = volatility or {}
+    weights = load_weights() if weights is None else weights
+    heap = []
+    for position, state in enumerate(states):
+        last = parse_ts(state.get("timestamp"))
+        if last is None or state.get("status") in RETRY_ALWAYS or now - last >= ttl_for(state, overrides):
+            heap.append((-priority(state, now, volatility, weights), position, state))
+    heapq.heapify(heap)
+    due = len(heap)
+
+    selected, credits = [], 0.0
+    while heap:
+        if max_urls and len(selected) >= max_urls:
+            break
+        score, _, state = heapq.heappop(heap)
+        cost = estimated_cost(state)
+        if max_credits and credits + cost > max_credits:
+            break
+        selected.append(state["catalog_link"])
+        credits += cost
+        if len(selected) <= 3:
+            logger.info(f"Plan #{len(selected)}: priority {-score:.2f} {state['catalog_link']}")
+
+    logger.info(
+        f"Plan: {len(selected)} of {len(states)} links due "
+        f"({due - len(selected)} deferred by caps, ~{credits:.0f} credits)."
+    )
+    return selected
+
+def next_states(rows, states_by_link):
+    """Planner state to persist after loading `rows` (discard streak and last success bookkeeping)."""
+    out = []
+    for row in rows:
+        previous = states_by_link.get(row["catalog_link"], {})
+        streak = (int(previous.get("discard_streak") or 0) + 1) if row["status"] == "discarded" else 0
+        last_success = previous.get("last_success")
+        if row["status"] not in RETRY_ALWAYS:
+            last_success = row["timestamp"]
+        elif isinstance(last_success, datetime):
+            last_success = last_success.strftime("%Y-%m-%dT%H:%M:%S")
+        out.append({
+            "catalog_link": row["catalog_link"],
+            "discard_streak": streak,
+            "last_status": row["status"],
+            "updated_at": row["timestamp"],
+            "last_success": last_success,
+        })
+    return out
@@ -0,0 +1,109 @@
+from app.database.db_manager import get_profile_memory, save_profile_memory
+from app.settings.config import PROFILE_DEMOTE_AFTER, PROFILE_PROBE_AFTER
+from app.utils.logger import logger
+import threading
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CONSTANTS
+# ──────────────────────────────────────────────────────────────────────────────
+# Every ScrapeConfig profile a URL can go through, cheapest first:
+# first pass (first_scrapp.SCRAPE_PROFILES) then the retry ladder (second_scrapp.stage_configs).
+PROFILE_LADDER = [
+    "fast", "rendered",
+    "first_attempt", "second_attempt", "heavy_retry", "rescue_pass", "deep_rescue",
+]
+FIRST_PASS_PROFILES = ("fast", "rendered")
+DONE_STATUSES = ("successed", "discarded")
+
+# ──────────────────────────────────────────────────────────────────────────────
+# HELPERS
+# ──────────────────────────────────────────────────────────────────────────────
+def attempt_profile(row):
+    """Profile an attempt row was fetched with."""
+    return row.get("retry_stage") or row.get("_profile") or "rendered"
+
+def rank(profile):
+    return PROFILE_LADDER.index(profile) if profile in PROFILE_LADDER else 0
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CORE
+# ──────────────────────────────────────────────────────────────────────────────
+class ProfileMemory:
+    """
+    Per-URL memory of the cheapest profile that works.
+
+    A URL starts at its learned profile. When that profile fails and a more
+    expensive one succeeds, the failure is counted; after PROFILE_DEMOTE_AFTER
+    consecutive failures the URL is moved to the profile that worked. After
+    PROFILE_PROBE_AFTER consecutive successes it is moved one profile cheaper
+    again (a bad proxy night must not pin it to the top of the ladder); one
+    failure there sends it back. The cost of the winning attempt is stored
+    alongside.
+    """
+
+    def __init__(self, known=None, demote_after=PROFILE_DEMOTE_AFTER, probe_after=PROFILE_PROBE_AFTER):
+        self.known = known or {}
+        self.demote_after = demote_after
+        self.probe_after = probe_after
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        memory = cls(get_profile_memory())
+        logger.info(f"Profile memory loaded: {len(memory.known)} links.")
+        return memory
+
+    def start_for(self, url):
+        """Profile to start `url` at ("fast" when nothing is known)."""
+        return (self.known.get(url) or {}).get("profile", PROFILE_LADDER[0])
+
+    def observe(self, attempts):
+        """
+        Learn from every attempt of one URL (first pass + retries) in this run.
+        Failed attempts that stop short of the last ladder stage (run cancelled,
+        deadline, credit ceiling) say nothing about the URL and are ignored.
+        """
+        winner = next((a for a in attempts if a["_status"] in DONE_STATUSES), None)
+        if winner is None and attempt_profile(attempts[-1]) != PROFILE_LADDER[-1]:
+            return
+        url = attempts[0]["_url"]
+        current = self.known.get(url) or {"profile": PROFILE_LADDER[0], "fail_streak": 0, "api_cost": None}
+        state = {**current, "catalog_link": url, "updated_at": attempts[-1].get("_timestamp")}
+        state["ok_streak"] = int(current.get("ok_streak") or 0)
+
+        if winner is None:
+            state["fail_streak"] = int(current["fail_streak"] or 0) + 1
+            state["ok_streak"] = 0
+        elif rank(attempt_profile(winner)) <= rank(current["profile"]):
+            state["fail_streak"] = 0
+            state["ok_streak"] += 1
+            state["api_cost"] = winner.get("_api_cost")
+            if self.probe_after and state["ok_streak"] >= self.probe_after and rank(current["profile"]) > 0:
+                cheaper = PROFILE_LADDER[rank(current["profile"]) - 1]
+                logger.info(f"Probing {current['profile']} -> {cheaper} for {url}")
+                # one failure at the cheaper profile is enough to go back
+                state["profile"], state["ok_streak"] = cheaper, 0
+                state["fail_streak"] = max(0, self.demote_after - 1)
+        else:
+            streak = int(current["fail_streak"] or 0) + 1
+            if streak >= self.demote_after:
+                logger.info(f"Demoting {current['profile']} -> {attempt_profile(winner)} for {url}")
+                state["profile"], streak = attempt_profile(winner), 0
+            state["fail_streak"] = streak
+            state["ok_streak"] = 0
+            state["api_cost"] = winner.get("_api_cost")
+
+        try:
+            state["api_cost"] = float(state["api_cost"]) if state["api_cost"] is not None else None
+        except (TypeError, ValueError):
+            state["api_cost"] = None
+        with self._lock:
+            self.known[url] = state
+            self._pending[url] = state
+
+    def flush(self):
+        """Persist what was learned since the last flush."""
+        with self._lock:
+            rows, self._pending = list(self._pending.values()), {}
+        save_profile_memory(rows)
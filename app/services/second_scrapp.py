@@ -1,9 +1,15 @@
 from scrapfly import ScrapflyClient, ScrapeConfig, ScrapflyScrapeError
-from app.settings.config import SCRAP_KEY
+from app.settings.config import SCRAP_KEY, EXTRACT_OFFERS
 from app.utils.logger import logger
+from app.services.extractor import extract_fields, extract_offers, DISCARD_PHRASE, EMPTY_FIELDS
+from app.services.concurrency import make_limiter, size_client_pool
+from app.services.first_scrapp import fetch, make_parse_pool
+from app.services.checkpoint import open_checkpoint
+from app.services import metrics
+from app.services.archive import open_archive
+from contextlib import nullcontext
 from datetime import datetime
-from bs4 import BeautifulSoup
-import os, json, uuid, time
+import os, json, uuid, asyncio
 
 # ──────────────────────────────────────────────────────────────────────────────
 # PATHS / CONSTANTS / VARIABLES
@@ -12,8 +18,7 @@ BASE_DIR = os.path.dirname(__file__)
 DATABASE_DIR = os.path.join(BASE_DIR, '../database')
 FAILED_JSON_PATH = os.path.join(DATABASE_DIR, 'scrap_results.json')
 OUTPUT_JSON_PATH = os.path.join(DATABASE_DIR, 'scrapping_failed_urls.json')
-DISCARD_PHRASE = "Este producto no está disponible. Elige otra variante."
-scrapped_results = []
+DONE_STATUSES = ("successed", "discarded")
 
 # ──────────────────────────────────────────────────────────────────────────────
 # HELPERS
@@ -34,157 +39,203 @@ def read_failed():
 def api_cost(response):
     return getattr(getattr(response, "response", None), "headers", {}).get("X-Scrapfly-Api-Cost", "n/a")
 
-def parse_product(url, response):
-    html = response.content
-    soup = BeautifulSoup(html, "html.parser")
-
-    # Check availability
-    msg_el = soup.find(class_="ui-pdp-shipping-message__text")
-    if msg_el and DISCARD_PHRASE in msg_el.get_text(strip=True):
-        parsed = {
-            "title": "n/a",
-            "price": "",
-            "competitor": "n/a",
-            "price_in_installments": "n/a",
-            "image": "n/a",
-            "_url": url,
-            "_timestamp": now_ts(),
-            "_status": "discarded",
-            "_api_cost": api_cost(response)
-        }
-        logger.warning(f"Discarded (not available)..")
-        return parsed
+def parse_product(url, html, cost):
+    """Parse a retried PDP (runs on the parse pool)."""
+    fields = extract_fields(html, DISCARD_PHRASE)
+    row = {
+        **fields,
+        "_url": url,
+        "_timestamp": now_ts(),
+        "_status": fields["_status"],
+        "_api_cost": cost,
+    }
+    if EXTRACT_OFFERS and fields["_status"] == "successed":
+        row["_offers"] = extract_offers(html, fields)
+    return row
 
-    # Extract fields
-    t = soup.find("h1", class_="ui-pdp-title")
-    precio_container = soup.find("div", {"class": "ui-pdp-price__second-line"})
-    p = precio_container.find("span", {"class": "andes-money-amount__fraction"}) if precio_container else None
-    c = soup.find("h2", class_="ui-seller-data-header__title")
-    q = soup.find("div", class_="ui-pdp-price__subtitles")
-    img = soup.find("img", class_="ui-pdp-image")
-    parsed = {
-        "title": (t.text.strip() if t else "n/a"),
-        "price": (p.text.strip() if p else ""),
-        "competitor": (c.text.strip() if c else "n/a"),
-        "price_in_installments": (q.text.strip() if q else "n/a"),
-        "image": (img["src"] if (img and img.get("src")) else "n/a"),
+def error_row(url, status, stage, reason):
+    return {
+        **EMPTY_FIELDS,
         "_url": url,
         "_timestamp": now_ts(),
-        "_status": "successed",
-        "_api_cost": api_cost(response),
+        "_status": status,
+        "_api_cost": "n/a",
+        "retry_stage": stage,
+        "failure_reason": reason,
     }
 
-    if parsed["title"] == "n/a":
-        parsed["_status"] = "failed"
-        logger.error(f"Failed to parse title.")
-    else:
-        logger.info(f"Successed retry..")
-    
-    return parsed
+# ──────────────────────────────────────────────────────────────────────────────
+# RETRY LADDER
+# ──────────────────────────────────────────────────────────────────────────────
+def stage_configs():
+    """
+    Escalating retry stages as (name, builder) pairs.
+    Each builder returns the config of one URL so sessions are never shared
+    between concurrent requests.
+    """
+    def base():
+        return dict(
+            asp=True,
+            render_js=True,
+            wait_for_selector="h1.ui-pdp-title",
+            proxy_pool="public_residential_pool",  # must be valid
+            country="ar",
+            lang=["es-AR", "es"],
+            session_sticky_proxy=True,
+            retry=True,
+            session=f"FAILED-{uuid.uuid4()}",
+        )
+
+    return [
+        ("first_attempt", lambda: base()),
+        ("second_attempt", lambda: {**base(), "rendering_wait": 10_000, "auto_scroll": True}),
+        ("heavy_retry", lambda: {**base(), "rendering_wait": 12_000, "auto_scroll": True, "session": f"HEAVY-{uuid.uuid4()}"}),
+        ("rescue_pass", lambda: {**base(), "rendering_wait": 15_000, "auto_scroll": True, "session": f"RESCUE-{uuid.uuid4()}"}),
+        ("deep_rescue", lambda: {**base(), "rendering_wait": 15_000, "wait_for_selector": None, "proxy_pool": "public_residential_pool", "session": f"DEEP-{uuid.uuid4()}"}),
+    ]
 
 # ──────────────────────────────────────────────────────────────────────────────
 # ATTEMPT HELPER
 # ──────────────────────────────────────────────────────────────────────────────
-def scrape_attempt(client, url, config, stage):
+async def scrape_attempt(client, url, config, stage, limiter=None, parse_pool=None, archive=None, governor=None):
     try:
         # Remove timeout if retry=True
         if config.get("retry", False):
             config.pop("timeout", None)
-        response = client.scrape(ScrapeConfig(url=url, **config))
-        parsed = parse_product(url, response)
+        # without a limiter (one-off retries) the request runs unthrottled
+        async with limiter if limiter is not None else nullcontext():
+            response = await fetch(client, ScrapeConfig(url=url, **config), limiter, profile=stage, governor=governor)
+        if archive is not None:
+            await archive.save(parse_pool, url, response.content, stage, api_cost(response), now_ts())
+        loop = asyncio.get_running_loop()
+        with metrics.PARSE_SECONDS.time(profile=stage):
+            parsed = await loop.run_in_executor(parse_pool, parse_product, url, response.content, api_cost(response))
         parsed["retry_stage"] = stage
-        parsed["failure_reason"] = None if parsed["_status"] in ["successed", "discarded"] else "parse_failed"
-        scrapped_results.append(parsed)
+        parsed["failure_reason"] = None if parsed["_status"] in DONE_STATUSES else "parse_failed"
+        metrics.RESULTS.inc(stage=stage, status=parsed["_status"])
+        if governor is not None:
+            governor.done(stage, parsed["_status"] in DONE_STATUSES)
+
+        if parsed["_status"] == "discarded":
+            logger.warning(f"Discarded (not available)..")
+        elif parsed["_status"] == "failed":
+            logger.error(f"Failed to parse title.")
+        else:
+            logger.info(f"Successed retry..")
         return parsed
 
     except ScrapflyScrapeError as e:
         logger.error("SCRAPFLY ERROR..")
-        parsed = {
-            "title": "n/a",
-            "price": "",
-            "competitor": "n/a",
-            "price_in_installments": "n/a",
-            "image": "n/a",
-            "_url": url,
-            "_timestamp": now_ts(),
-            "_status": "SCRAPFLY ERROR",
-            "_api_cost": "n/a",
-            "retry_stage": stage,
-            "failure_reason": getattr(e, "error_code", "") or type(e).__name__,
-        }
-        scrapped_results.append(parsed)
-        return parsed
+        metrics.RESULTS.inc(stage=stage, status="error")
+        if governor is not None:
+            governor.done(stage, False)
+        return error_row(url, "SCRAPFLY ERROR", stage, getattr(e, "code", "") or type(e).__name__)
 
     except Exception as e:
         logger.error("UNEXPECTED ERROR..")
-        parsed = {
-            "title": "n/a",
-            "price": "",
-            "competitor": "n/a",
-            "price_in_installments": "n/a",
-            "image": "n/a",
-            "_url": url,
-            "_timestamp": now_ts(),
-            "_status": "UNEXPECTED ERROR",
-            "_api_cost": "n/a",
-            "retry_stage": stage,
-            "failure_reason": f"UNEXPECTED {type(e).__name__}",
-        }
-        scrapped_results.append(parsed)
-        return parsed
-
-# ──────────────────────────────────────────────────────────────────────────────
-# CORE: scrape a single failed URL
-# ──────────────────────────────────────────────────────────────────────────────
-def scrape_one(client, session_id, url):
-    base = dict(
-        asp=True,
-        render_js=True,
-        wait_for_selector="h1.ui-pdp-title",
-        proxy_pool="public_residential_pool",  # must be valid
-        country="ar",
-        lang=["es-AR", "es"],
-        session_sticky_proxy=True,
-        retry=True,
-        session=session_id,
-    )
-
-    stages = [
-        ("first_attempt", base.copy()),
-        ("second_attempt", {**base, "rendering_wait": 10_000, "auto_scroll": True}),
-        ("heavy_retry", {**base, "rendering_wait": 12_000, "auto_scroll": True, "session": f"HEAVY-{uuid.uuid4()}"}),
-        ("rescue_pass", {**base, "rendering_wait": 15_000, "auto_scroll": True, "session": f"RESCUE-{uuid.uuid4()}"}),
-        ("deep_rescue", {**base, "rendering_wait": 15_000, "wait_for_selector": None, "proxy_pool": "public_residential_pool", "session": f"DEEP-{uuid.uuid4()}"})
-    ]
-
-    for stage_name, cfg in stages:
+        metrics.RESULTS.inc(stage=stage, status="error")
+        if governor is not None:
+            governor.done(stage, False)
+        return error_row(url, "UNEXPECTED ERROR", stage, f"UNEXPECTED {type(e).__name__}")
+
+async def retry_ladder(client, url, limiter, parse_pool=None, start_stage=None, archive=None, governor=None):
+    """
+    Climb the ladder for a single URL until one stage succeeds, optionally
+    starting at `start_stage` (the stage that worked for this URL before).
+    Used by the streaming pipeline, where failed URLs arrive one by one.
+    A `governor` (governor.CreditGovernor) can stop the climb to stay within the credit ceiling.
+    """
+    stages = stage_configs()
+    names = [name for name, _ in stages]
+    if start_stage in names:
+        stages = stages[names.index(start_stage):]
+    attempts = []
+    for stage_name, build in stages:
+        if governor is not None and not await governor.allow(stage_name):
+            logger.info(f"{stage_name} skipped (credit ceiling)..")
+            return attempts
         logger.info(f"{stage_name}..")
-        out = scrape_attempt(client, url, cfg, stage_name)
-        if out["_status"] in ["successed", "discarded"]:
-            return
+        out = await scrape_attempt(client, url, build(), stage_name, limiter, parse_pool, archive, governor)
+        attempts.append(out)
+        if out["_status"] in DONE_STATUSES:
+            return attempts
     logger.info(f"All retries failed..")
+    return attempts
 
 # ──────────────────────────────────────────────────────────────────────────────
-# ORCHESTRATOR
+# ORCHESTRATOR: stage-batched ladder
 # ──────────────────────────────────────────────────────────────────────────────
-def scrape_all_failed(urls):
-    client = ScrapflyClient(key=SCRAP_KEY)
-    session_id = f"FAILED-{uuid.uuid4()}"
+async def scrape_all_failed(urls, checkpoint=None, start_stage=None, archive=None):
+    """
+    Retry failed URLs concurrently, one ladder stage at a time: every pending
+    URL tries stage 1 together, the ones still failing move to stage 2, etc.
+    `start_stage` maps URL -> ladder index to join at (resumed runs).
+    Returns every attempt row (json_merge keeps the last one per URL).
+    """
+    limiter = make_limiter()
+    client = size_client_pool(ScrapflyClient(key=SCRAP_KEY), limiter)
+    parse_pool = make_parse_pool()
+    start_stage = start_stage or {}
+    results = []
+    pending = []
     logger.info(f"Retrying {len(urls)} failed URLs..")
-    for url in urls:
-        scrape_one(client, session_id, url)
-        time.sleep(0.8)
-    return scrapped_results
+
+    try:
+        for index, (stage_name, build) in enumerate(stage_configs()):
+            pending += [url for url in urls if start_stage.get(url, 0) == index]
+            if not pending:
+                continue
+            logger.info(f"{stage_name}: {len(pending)} URLs..")
+            outs = await asyncio.gather(*(
+                scrape_attempt(client, url, build(), stage_name, limiter, parse_pool, archive) for url in pending
+            ))
+            results.extend(outs)
+            if checkpoint is not None:
+                for out in outs:
+                    checkpoint.append(out)
+            pending = [out["_url"] for out in outs if out["_status"] not in DONE_STATUSES]
+    finally:
+        parse_pool.shutdown(wait=True)
+        client.async_executor.shutdown(wait=False)
+
+    if pending:
+        logger.info(f"All retries failed for {len(pending)} URLs..")
+    return results
 
 # ──────────────────────────────────────────────────────────────────────────────
 # MAIN ENTRY
 # ──────────────────────────────────────────────────────────────────────────────
-def scrap_urls_failed():
+def resume_plan(previous):
+    """
+    From the attempts already checkpointed, work out which URLs are finished
+    and the ladder index every other URL should continue from.
+    """
+    names = [name for name, _ in stage_configs()]
+    finished, start_stage = set(), {}
+    for row in previous:
+        url = row["_url"]
+        next_index = names.index(row["retry_stage"]) + 1
+        if row["_status"] in DONE_STATUSES or next_index >= len(names):
+            finished.add(url)
+        else:
+            start_stage[url] = max(start_stage.get(url, 0), next_index)
+    return finished, {url: i for url, i in start_stage.items() if url not in finished}
+
+def scrap_urls_failed(run_id=None, resume=False):
     logger.info("START - Second Scrapping Method.")
     failed_urls = read_failed()
     if not failed_urls:
         logger.info("END - Not failed URLs found.")
         return
-    results = scrape_all_failed(failed_urls)
-    write_results(results)
+    checkpoint = open_checkpoint("second", run_id, resume)
+    previous = checkpoint.records()
+    finished, start_stage = resume_plan(previous)
+    failed_urls = [u for u in failed_urls if u not in finished]
+    if previous:
+        logger.info(f"Resuming: {len(finished)} URLs already finished, {len(failed_urls)} left.")
+    archive = open_archive(checkpoint.run_id)
+    results = asyncio.run(scrape_all_failed(failed_urls, checkpoint, start_stage, archive))
+    if archive is not None:
+        archive.close()
+    write_results(previous + results)
     logger.info("END - Second Scrapping Method.")
@@ -0,0 +1,101 @@
+from app.settings.config import SHARD_EXECUTION
+from app.utils.logger import logger
+from datetime import datetime
+import zlib
+
+# ──────────────────────────────────────────────────────────────────────────────
+# SHARD SPEC
+# ──────────────────────────────────────────────────────────────────────────────
+class ShardSpec:
+    """
+    `index` of `count` instances splitting one run. Links are assigned by a
+    stable hash, so every link lands in exactly one shard whatever order the
+    database returns them in.
+    """
+
+    def __init__(self, index=0, count=1):
+        index, count = int(index), int(count)
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Invalid shard {index}/{count}")
+        self.index = index
+        self.count = count
+
+    @property
+    def enabled(self):
+        return self.count > 1
+
+    def owns(self, link):
+        return zlib.crc32(link.encode("utf-8")) % self.count == self.index
+
+    def select(self, items, key=lambda item: item):
+        return [item for item in items if self.owns(key(item))]
+
+    def suffix(self):
+        """Checkpoint-name suffix ('' for an unsharded run)."""
+        return f"_s{self.index}of{self.count}" if self.enabled else ""
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+def default_run_id():
+    """
+    Run ID shared by the shards of one execution when the trigger sends none:
+    the Cloud Run job execution. None outside a job (the trigger must send one).
+    """
+    return SHARD_EXECUTION or None
+
+# ──────────────────────────────────────────────────────────────────────────────
+# COORDINATOR
+# ──────────────────────────────────────────────────────────────────────────────
+# db_manager (SQLAlchemy) is imported on use: the webhook builds ShardSpecs at request time
+def mark_shard(run_id, shard, status, urls=None):
+    from app.database.db_manager import save_shard_status
+
+    save_shard_status({
+        "run_id": run_id,
+        "shard_index": shard.index,
+        "shard_count": shard.count,
+        "status": status,
+        "urls": urls,
+        "execution": SHARD_EXECUTION,
+        "updated_at": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+
+def shard_report(run_id, count=None, execution=None):
+    """
+    Progress of every shard of `run_id`:
+    {"count", "finished", "running", "missing", "done"}.
+    Only rows of `execution` count (default: the execution that wrote last), so a
+    re-run under the same run ID is not "done" with the previous run's rows.
+    """
+    from app.database.db_manager import get_shard_statuses
+
+    rows = get_shard_statuses(run_id)
+    if execution is None and rows:
+        execution = max(rows, key=lambda r: r["updated_at"] or "")["execution"]
+    if execution is not None:
+        rows = [r for r in rows if (r["execution"] or "") == execution]
+    count = count or max((r["shard_count"] for r in rows), default=0)
+    finished = sorted(r["shard_index"] for r in rows if r["status"] == "finished")
+    running = sorted(r["shard_index"] for r in rows if r["status"] == "running")
+    seen = {r["shard_index"] for r in rows}
+    report = {
+        "count": count,
+        "finished": finished,
+        "running": running,
+        "missing": [i for i in range(count) if i not in seen],
+        "done": count > 0 and len(finished) == count,
+    }
+    logger.info(f"Shards of {run_id}: {len(finished)}/{count} finished, running={running}, missing={report['missing']}")
+    return report
+
+def claim_notification(run_id, shard):
+    """Whether this shard sends the run's closing notification (only one shard gets True)."""
+    from app.database.db_manager import claim_shard_notification
+
+    claimed = claim_shard_notification(
+        run_id, SHARD_EXECUTION, shard.index, datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+    )
+    if not claimed:
+        logger.info(f"Closing notification of {run_id} already sent by another shard.")
+    return claimed
@@ -0,0 +1,54 @@
+from app.settings.config import DB_PREWARM
+from app.utils.logger import logger
+import importlib, threading, time
+
+# ──────────────────────────────────────────────────────────────────────────────
+# SCRAPING STACK
+# The webhook only imports Flask, the job manager and the metrics registry; the
+# modules below (bs4/lxml, Scrapfly SDK, SQLAlchemy, ...) load on the
+# first dispatched job, or earlier through warm_up().
+# ──────────────────────────────────────────────────────────────────────────────
+STACK = (
+    "app.services.pipeline_scrapping",
+    "app.services.archive",
+)
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_state = {"seconds": None, "db": False, "error": None}
+
+def warm_up(db=DB_PREWARM):
+    """
+    Import the scraping stack (and open the DB pool when `db`). Idempotent and
+    thread safe; returns {"ready", "seconds", "db", "error"}.
+    """
+    with _lock:
+        if not _ready.is_set():
+            started = time.perf_counter()
+            try:
+                for name in STACK:
+                    importlib.import_module(name)
+                _state["seconds"] = round(time.perf_counter() - started, 3)
+                _ready.set()
+                logger.info(f"Scraping stack loaded in {_state['seconds']:.2f}s")
+            except Exception as e:
+                _state["error"] = f"{type(e).__name__}: {e}"
+                logger.exception("Warm-up failed")
+        if db and _ready.is_set() and not _state["db"]:
+            try:
+                from app.database.db_manager import warm_pool
+                warm_pool()
+                _state["db"] = True
+            except Exception as e:
+                _state["error"] = f"{type(e).__name__}: {e}"
+                logger.warning(f"DB warm-up failed: {_state['error']}")
+    return status()
+
+def start_warm_up(db=DB_PREWARM):
+    """warm_up() on a daemon thread: the server answers while the stack loads."""
+    thread = threading.Thread(target=warm_up, kwargs={"db": db}, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+def status():
+    return {"ready": _ready.is_set(), **_state}
@@ -1,9 +1,22 @@
-import threading
-from app.services.pipeline_scrapping import scrapping
+from app.services.sharding import ShardSpec, shard_report
+from app.services.jobs import JobManager
 from app.settings.config import SECRET_GUIAS
 from flask import Blueprint, request, Response, jsonify
 from app.utils.logger import logger
 
+# Un solo manager por proceso (gunicorn corre 1 worker)
+jobs = JobManager()
+
+# El stack de scraping (bs4/lxml, Scrapfly, SQLAlchemy) se importa en el hilo
+# del job, no al levantar el server: el 202 no espera el cold start
+def scrapping(**kwargs):
+    from app.services.pipeline_scrapping import scrapping
+    return scrapping(**kwargs)
+
+def reparse(**kwargs):
+    from app.services.archive import reparse
+    return reparse(**kwargs)
+
 # BLUEPRINT CREATION
 scrapping_event = Blueprint("scrapping_init", __name__, url_prefix="/webhooks/start_scrapping")
 @scrapping_event.route("", methods=["POST"], strict_slashes=False)
@@ -11,12 +24,86 @@ def main():
     response = request.json
     if SECRET_GUIAS != response['secret']:
         return Response(status=401)
-    logger.info("Receving notification from App Import - Dispatching thread")
+    logger.info("Receving notification from App Import - Dispatching job")
+    shard = None
+    if "shard_count" in response:
+        try:
+            shard = ShardSpec(response.get("shard_index", 0), response["shard_count"])
+        except (TypeError, ValueError) as e:
+            return jsonify({"status": "rejected", "message": str(e)}), 400
+        if shard.enabled and not response.get("run_id"):
+            # la fecha no sirve de ID: se comparte entre corridas del mismo día
+            return jsonify({"status": "rejected", "message": "run_id is required for a sharded run"}), 400
+    try:
+        top_n = int(response["top_n"]) if response.get("top_n") else None
+        deadline_minutes = float(response["deadline_minutes"]) if response.get("deadline_minutes") else None
+    except (TypeError, ValueError):
+        return jsonify({"status": "rejected", "message": "top_n and deadline_minutes must be numbers"}), 400
 
-    # 1. Creamos y lanzamos el hilo con la lógica pesada
-    # Pasamos una copia de los datos para evitar problemas de contexto
-    thread = threading.Thread(target=scrapping, args=())
-    thread.start()
+    # 1. Encolamos la corrida en el executor acotado (single-flight por defecto)
+    # run_id + resume=True continúa una corrida interrumpida desde su checkpoint
+    # shard_index/shard_count reparten los links entre varias instancias
+    # top_n/deadline_minutes: corrida parcial con los links de mayor prioridad
+    job, accepted = jobs.submit(
+        scrapping,
+        job_id=response.get("run_id"),
+        run_id=response.get("run_id"),
+        resume=bool(response.get("resume")),
+        shard=shard,
+        top_n=top_n,
+        deadline_minutes=deadline_minutes,
+    )
+    if not accepted:
+        # 409: ya hay una corrida activa, no lanzamos otra en paralelo
+        return jsonify({"status": "rejected", "message": "A run is already active", "job": job.to_dict()}), 409
     # 2. Respondemos de inmediato
     # 202 significa "Accepted" (aceptado para procesamiento, pero no completado aún)
-    return jsonify({"status": "accepted", "message": "Task dispatched to background"}), 202
\ No newline at end of file
+    return jsonify({"status": "accepted", "message": "Task dispatched to background", "job": job.to_dict()}), 202
+
+@scrapping_event.route("/reparse", methods=["POST"])
+def reparse_run():
+    """Re-run the extractor over archived pages and reload the database (no Scrapfly calls)."""
+    response = request.json or {}
+    if SECRET_GUIAS != response.get("secret"):
+        return Response(status=401)
+    run_ids = response.get("run_ids") or response.get("run_id")
+    if not run_ids:
+        return jsonify({"status": "rejected", "message": "run_ids is required"}), 400
+    job, accepted = jobs.submit(reparse, run_ids=run_ids)
+    if not accepted:
+        return jsonify({"status": "rejected", "message": "A run is already active", "job": job.to_dict()}), 409
+    return jsonify({"status": "accepted", "message": "Re-parse dispatched to background", "job": job.to_dict()}), 202
+
+@scrapping_event.route("/jobs", methods=["GET"])
+def list_jobs():
+    if SECRET_GUIAS != request.args.get("secret"):
+        return Response(status=401)
+    return jsonify([job.to_dict() for job in jobs.jobs.values()]), 200
+
+@scrapping_event.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Stage, done/failed counts and elapsed time of one run."""
+    if SECRET_GUIAS != request.args.get("secret"):
+        return Response(status=401)
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "not_found"}), 404
+    return jsonify(job.to_dict()), 200
+
+@scrapping_event.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    """Stop scheduling new requests; rows already scraped are still loaded."""
+    response = request.json or {}
+    if SECRET_GUIAS != response.get("secret"):
+        return Response(status=401)
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"status": "not_found"}), 404
+    return jsonify(job.to_dict()), 202
+
+@scrapping_event.route("/shards/<run_id>", methods=["GET"])
+def shards(run_id):
+    """Coordinator view: which shards of a run have finished."""
+    if SECRET_GUIAS != request.args.get("secret"):
+        return Response(status=401)
+    return jsonify(shard_report(run_id)), 200
@@ -14,4 +14,75 @@ MELI_SCHMA=os.getenv("MELI_SCHMA")
 TOKEN_WHAPI=os.getenv("TOKEN_WHAPI")
 PHONE=os.getenv("PHONE")
 
-SECRET_GUIAS=os.getenv("SECRET_GUIAS")
\ No newline at end of file
+SECRET_GUIAS=os.getenv("SECRET_GUIAS")
+
+PARSE_POOL_KIND=os.getenv("PARSE_POOL_KIND", "thread")  # "thread" | "process"
+PARSE_POOL_WORKERS=int(os.getenv("PARSE_POOL_WORKERS", os.cpu_count() or 4))
+EXTRACTOR_BACKEND=os.getenv("EXTRACTOR_BACKEND", "lxml")  # "lxml" | "bs4"
+EXTRACTOR_MODE=os.getenv("EXTRACTOR_MODE", "dom")  # "dom" | "json"
+SCRAP_FAST_PATH=os.getenv("SCRAP_FAST_PATH", "1") == "1"  # try without JS rendering first
+EXTRACT_OFFERS=os.getenv("EXTRACT_OFFERS", "0") == "1"  # also keep every seller offer of a catalog page
+
+SCRAP_CONCURRENCY_FLOOR=int(os.getenv("SCRAP_CONCURRENCY_FLOOR", 2))
+SCRAP_CONCURRENCY_CEILING=int(os.getenv("SCRAP_CONCURRENCY_CEILING", 20))
+SCRAP_CONCURRENCY_INITIAL=int(os.getenv("SCRAP_CONCURRENCY_INITIAL", 5))
+SCRAP_TARGET_LATENCY=float(os.getenv("SCRAP_TARGET_LATENCY", 45))  # seconds
+
+PIPELINE_QUEUE_SIZE=int(os.getenv("PIPELINE_QUEUE_SIZE", 100))
+PIPELINE_SINK_BATCH=int(os.getenv("PIPELINE_SINK_BATCH", 200))
+
+CHECKPOINT_DIR=os.getenv("CHECKPOINT_DIR", os.path.join(os.path.dirname(__file__), "../database/checkpoints"))
+
+DB_LOAD_CHUNK=int(os.getenv("DB_LOAD_CHUNK", 1000))
+DB_COMMIT_PER_CHUNK=os.getenv("DB_COMMIT_PER_CHUNK", "1") == "1"
+
+DB_URL=os.getenv("DB_URL")  # optional local stand-in (sqlite:///..., mysql+pymysql://...)
+DB_POOL_SIZE=int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW=int(os.getenv("DB_MAX_OVERFLOW", 2))
+DB_PREWARM=os.getenv("DB_PREWARM", "0") == "1"
+DB_CHANGE_ONLY=os.getenv("DB_CHANGE_ONLY", "1") == "1"  # write only rows that changed, keep a price history
+
+PLAN_TTL_HOURS=float(os.getenv("PLAN_TTL_HOURS", 24))
+PLAN_TTL_FILE=os.getenv("PLAN_TTL_FILE")  # JSON {catalog_link: ttl_hours}
+PLAN_DISCARD_BACKOFF_HOURS=float(os.getenv("PLAN_DISCARD_BACKOFF_HOURS", 24))
+PLAN_DISCARD_MAX_HOURS=float(os.getenv("PLAN_DISCARD_MAX_HOURS", 24 * 30))
+PLAN_MAX_URLS=int(os.getenv("PLAN_MAX_URLS", 0))  # 0 = no cap
+PLAN_MAX_CREDITS=int(os.getenv("PLAN_MAX_CREDITS", 0))  # 0 = no cap
+PLAN_DEFAULT_COST=float(os.getenv("PLAN_DEFAULT_COST", 25))
+PLAN_WEIGHT_FILE=os.getenv("PLAN_WEIGHT_FILE")  # JSON {catalog_link: business weight}, default 1
+PLAN_VOLATILITY_DAYS=float(os.getenv("PLAN_VOLATILITY_DAYS", 30))  # price history window for the change rate
+PLAN_VOLATILITY_PRIOR=float(os.getenv("PLAN_VOLATILITY_PRIOR", 0.1))  # changes/day every link is assumed to have
+PLAN_NEVER_AGE_HOURS=float(os.getenv("PLAN_NEVER_AGE_HOURS", 24 * 30))  # age given to never scraped links
+PLAN_DEADLINE_MINUTES=float(os.getenv("PLAN_DEADLINE_MINUTES", 0))  # partial runs: no new URLs after this, 0 = none
+
+PROFILE_DEMOTE_AFTER=int(os.getenv("PROFILE_DEMOTE_AFTER", 2))  # failures before a cheap profile is skipped
+PROFILE_PROBE_AFTER=int(os.getenv("PROFILE_PROBE_AFTER", 5))  # successes before one cheaper profile is tried again, 0 = never
+
+HEDGE_ENABLED=os.getenv("HEDGE_ENABLED", "0") == "1"
+HEDGE_PERCENTILE=float(os.getenv("HEDGE_PERCENTILE", 0.95))
+HEDGE_BUDGET=int(os.getenv("HEDGE_BUDGET", 50))  # max hedged requests per run
+HEDGE_MIN_SAMPLES=int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+
+GOVERNOR_MAX_CREDITS=float(os.getenv("GOVERNOR_MAX_CREDITS", 0))  # per run ceiling, 0 = none
+GOVERNOR_USE_ACCOUNT=os.getenv("GOVERNOR_USE_ACCOUNT", "1") == "1"  # also cap at the credits left in the account
+GOVERNOR_RESERVE=float(os.getenv("GOVERNOR_RESERVE", 0))  # account credits never spent by a run
+GOVERNOR_MAX_STAGE=os.getenv("GOVERNOR_MAX_STAGE", "first_attempt")  # last ladder stage kept when over budget
+GOVERNOR_PRIOR_WEIGHT=float(os.getenv("GOVERNOR_PRIOR_WEIGHT", 3))  # pseudo-requests behind the default cost
+
+# Defaults come from Cloud Run job task variables when present
+SHARD_INDEX=int(os.getenv("SHARD_INDEX", os.getenv("CLOUD_RUN_TASK_INDEX", 0)))
+SHARD_COUNT=int(os.getenv("SHARD_COUNT", os.getenv("CLOUD_RUN_TASK_COUNT", 1)))
+SHARD_EXECUTION=os.getenv("CLOUD_RUN_EXECUTION", "")  # one job execution, shared by all its tasks
+
+JOB_MAX_WORKERS=int(os.getenv("JOB_MAX_WORKERS", 1))
+JOB_QUEUE_SIZE=int(os.getenv("JOB_QUEUE_SIZE", 0))  # 0 = single-flight, reject while a run is active
+
+METRICS_DIR=os.getenv("METRICS_DIR", os.path.join(os.path.dirname(__file__), "../database/metrics"))  # per-run JSON summaries
+METRICS_SECRET=os.getenv("METRICS_SECRET")  # optional ?secret= for /metrics
+
+ARCHIVE_ENABLED=os.getenv("ARCHIVE_ENABLED", "0") == "1"  # keep the raw HTML of every fetched page
+ARCHIVE_DIR=os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "../database/archive"))
+ARCHIVE_LEVEL=int(os.getenv("ARCHIVE_LEVEL", 10))  # zstd level (zlib fallback caps it at 9)
+ARCHIVE_MAX_RUNS=int(os.getenv("ARCHIVE_MAX_RUNS", 14))
+ARCHIVE_MAX_MB=float(os.getenv("ARCHIVE_MAX_MB", 2048))
+WARMUP_ON_START=os.getenv("WARMUP_ON_START", "0") == "1"  # load the scraping stack in the background at boot
@@ -0,0 +1,157 @@
+from scrapfly import ScrapflyAspError, ScrapflyThrottleError, ScrapflyScrapeError
+from concurrent.futures import ThreadPoolExecutor
+import asyncio, os, random, threading, time, zlib
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CORPUS
+# ──────────────────────────────────────────────────────────────────────────────
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Page kinds and the share of URLs that get each one by default
+DEFAULT_MIX = {
+    "normal_json": 0.55,   # JSON-LD + preloaded state: the fast path is enough
+    "normal": 0.25,        # DOM only: fast path escalates to a rendered scrape
+    "discarded": 0.10,     # "no está disponible"
+    "broken_layout": 0.07, # renamed classes until the retry ladder scrolls/waits
+    "blocked": 0.03,       # anti-bot page, ASP errors until the deeper stages
+}
+
+def load_corpus(directory=FIXTURES_DIR, pad_kb=0):
+    """{kind: html}. `pad_kb` appends inert markup to simulate heavier real pages."""
+    corpus = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".html"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                corpus[name[:-5]] = f.read()
+    if pad_kb:
+        filler = '<div class="ui-recommendations"><span>relleno</span></div>\n' * (pad_kb * 1024 // 58 + 1)
+        corpus = {kind: html.replace("</body>", filler + "</body>") for kind, html in corpus.items()}
+    return corpus
+
+def make_urls(count, prefix="https://www.mercadolibre.com.ar/p/MLA"):
+    return [f"{prefix}{10_000_000 + i}" for i in range(count)]
+
+# ──────────────────────────────────────────────────────────────────────────────
+# FAKE RESPONSES
+# ──────────────────────────────────────────────────────────────────────────────
+class _Upstream:
+    def __init__(self, headers):
+        self.headers = headers
+        self.status_code = 200
+
+class FakeScrapeResponse:
+    """The two attributes the scrapers read: `.content` and the cost header."""
+
+    def __init__(self, content, cost):
+        self.content = content
+        self.response = _Upstream({"X-Scrapfly-Api-Cost": str(cost)})
+
+# ──────────────────────────────────────────────────────────────────────────────
+# FAKE CLIENT
+# ──────────────────────────────────────────────────────────────────────────────
+class FakeScrapflyClient:
+    """
+    Stand-in for scrapfly.ScrapflyClient that answers from the fixture corpus.
+
+    Each URL maps to a page kind through a stable hash, so a run is
+    reproducible. Latency is log-normal around `latency_ms` (rendered requests
+    take `render_factor` times longer) and `throttle_rate` / `error_rate`
+    inject 429 throttles and scrape errors at random. Costs mimic Scrapfly:
+    1 credit plain, 5 with JS rendering, +25 with ASP.
+
+    Like the SDK, async_scrape runs the blocking request on `async_executor`
+    (a default ThreadPoolExecutor unless the app resizes it), so the thread
+    pool caps concurrency here as it does in production.
+    """
+
+    def __init__(self, corpus=None, mix=None, latency_ms=200.0, latency_sigma=0.5, render_factor=3.0,
+                 error_rate=0.0, throttle_rate=0.0, max_concurrency=None, seed=0, key=None):
+        self.corpus = corpus or load_corpus()
+        self.mix = mix or DEFAULT_MIX
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.render_factor = render_factor
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.credits = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.latencies = []
+        self.async_executor = ThreadPoolExecutor()
+        self._lock = threading.Lock()
+
+    # ---- page selection ----
+    def kind_for(self, url):
+        point = zlib.crc32(url.encode("utf-8")) % 10_000 / 10_000
+        for kind, share in self.mix.items():
+            if point < share:
+                return kind
+            point -= share
+        return next(iter(self.mix))
+
+    def _page(self, url, cfg):
+        kind = self.kind_for(url)
+        # the ladder stages with a long rendering wait (second_attempt onwards) get the full page
+        deep = (getattr(cfg, "rendering_wait", None) or 0) >= 10_000
+        if kind == "broken_layout" and deep:
+            return self.corpus["normal"]
+        if kind == "blocked":
+            if getattr(cfg, "asp", False) and deep:
+                return self.corpus["normal"]
+            raise ScrapflyAspError(
+                request=None, response=None, message="Anti-bot protection not bypassed",
+                code="ERR::ASP::SHIELD_PROTECTION_FAILED", http_status_code=422, is_retryable=True,
+            )
+        if kind == "normal" and not getattr(cfg, "render_js", False):
+            # without a browser the PDP is a shell with no product markup
+            return self.corpus["blocked"]
+        return self.corpus[kind]
+
+    def _cost(self, cfg):
+        return (5 if getattr(cfg, "render_js", False) else 1) + (25 if getattr(cfg, "asp", False) else 0)
+
+    def _latency(self, cfg):
+        seconds = self.random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+        return seconds * (self.render_factor if getattr(cfg, "render_js", False) else 1)
+
+    # ---- ScrapflyClient API ----
+    def scrape(self, scrape_config):
+        with self._lock:
+            self.calls += 1
+            if self.max_concurrency and self.in_flight >= self.max_concurrency:
+                raise ScrapflyThrottleError(
+                    request=None, response=None, message="Max concurrent requests reached",
+                    code="ERR::THROTTLE::MAX_CONCURRENT_REQUEST_EXCEEDED", http_status_code=429, retry_delay=1,
+                )
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            latency, roll = self._latency(scrape_config), self.random.random()
+        started = time.monotonic()
+        try:
+            time.sleep(latency)
+            if roll < self.throttle_rate:
+                raise ScrapflyThrottleError(
+                    request=None, response=None, message="Throttled",
+                    code="ERR::THROTTLE::MAX_REQUEST_RATE_EXCEEDED", http_status_code=429, retry_delay=1,
+                )
+            if roll < self.throttle_rate + self.error_rate:
+                raise ScrapflyScrapeError(
+                    request=None, response=None, message="Operation timeout",
+                    code="ERR::SCRAPE::OPERATION_TIMEOUT", http_status_code=422, is_retryable=True,
+                )
+            content = self._page(scrape_config.url, scrape_config)
+            cost = self._cost(scrape_config)
+            with self._lock:
+                self.credits += cost
+            return FakeScrapeResponse(content, cost)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.latencies.append(time.monotonic() - started)
+
+    async def async_scrape(self, scrape_config, loop=None):
+        loop = loop or asyncio.get_running_loop()
+        return await loop.run_in_executor(self.async_executor, self.scrape, scrape_config)
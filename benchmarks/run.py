@@ -0,0 +1,242 @@
+"""
+Offline benchmark of the scraping stack: no Scrapfly credits, no Cloud SQL.
+
+    python -m benchmarks.run --urls 500 --latency-ms 200 --out bench.json
+
+Scrapfly is replaced by benchmarks.fake_scrapfly.FakeScrapflyClient (pages
+from benchmarks/fixtures) and the database by a throwaway SQLite file.
+Reports URLs/s, p50/p95 latency, peak RSS and wall time for every stage.
+"""
+import argparse, asyncio, json, logging, os, resource, sys, tempfile, time
+
+# Settings are read at import time: point the app at SQLite before importing it
+_DB_DIR = tempfile.mkdtemp(prefix="scrap-bench-")
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}"
+os.environ["CHECKPOINT_DIR"] = os.path.join(_DB_DIR, "checkpoints")
+os.environ.pop("MELI_SCHMA", None)
+
+from app.database import db_manager
+from app.services import concurrency, extractor, first_scrapp, second_scrapp, json_merge, pipeline_scrapping, governor
+from benchmarks.fake_scrapfly import FakeScrapflyClient, load_corpus, make_urls
+from sqlalchemy import text
+
+# ──────────────────────────────────────────────────────────────────────────────
+# HELPERS
+# ──────────────────────────────────────────────────────────────────────────────
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def timed(fn, samples):
+    """Wrap an async function so every call's duration lands in `samples`."""
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - started)
+    return wrapper
+
+def report(name, items, elapsed, latencies=(), **extra):
+    stage = {
+        "stage": name,
+        "items": items,
+        "seconds": round(elapsed, 3),
+        "items_per_s": round(items / elapsed, 1) if elapsed else None,
+        "p50_ms": None if not latencies else round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": None if not latencies else round(percentile(latencies, 0.95) * 1000, 2),
+        "peak_rss_mb": peak_rss_mb(),
+        **extra,
+    }
+    print(f"{name:<18} {items:>6} items  {stage['seconds']:>8.2f}s  {stage['items_per_s'] or 0:>9.1f}/s  "
+          f"p50={stage['p50_ms']}ms p95={stage['p95_ms']}ms  rss={stage['peak_rss_mb']}MB", file=sys.stderr)
+    return stage
+
+def statuses(rows, key="_status"):
+    counts = {}
+    for row in rows:
+        counts[row[key]] = counts.get(row[key], 0) + 1
+    return counts
+
+def install_fakes(client):
+    """Route every ScrapflyClient(...) to `client` and silence the external calls."""
+    for module in (first_scrapp, second_scrapp, pipeline_scrapping):
+        module.ScrapflyClient = lambda key=None: client
+    concurrency.account_concurrency = lambda: None
+    governor.account_credits = lambda: None
+
+def seed_db(urls):
+    engine = db_manager.get_engine()
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS scrapped_competence"))
+        conn.execute(text("""
+            CREATE TABLE scrapped_competence (
+                catalog_link TEXT PRIMARY KEY, title TEXT, price INTEGER, competitor TEXT,
+                price_in_installments TEXT, image TEXT, timestamp TEXT, status TEXT, api_cost_total REAL
+            )
+        """))
+        conn.execute(text("INSERT INTO scrapped_competence (catalog_link) VALUES (:link)"), [{"link": u} for u in urls])
+
+# ──────────────────────────────────────────────────────────────────────────────
+# STAGES
+# ──────────────────────────────────────────────────────────────────────────────
+def bench_parse(corpus, rounds):
+    """Every extractor backend over the corpus; fields must match across backends."""
+    stages, outputs = [], {}
+    for backend in extractor.BACKENDS:
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for kind, html in corpus.items():
+                t0 = time.perf_counter()
+                outputs[(backend, kind)] = extractor.extract_fields(html, backend=backend, mode="dom")
+                latencies.append(time.perf_counter() - t0)
+        stages.append(report(f"parse[{backend}]", len(latencies), time.perf_counter() - started, latencies))
+    latencies, started = [], time.perf_counter()
+    for _ in range(rounds):
+        for html in corpus.values():
+            t0 = time.perf_counter()
+            extractor.extract_offers(html)
+            latencies.append(time.perf_counter() - t0)
+    stages.append(report("parse[offers]", len(latencies), time.perf_counter() - started, latencies))
+    backends = list(extractor.BACKENDS)
+    mismatches = [kind for kind in corpus for other in backends[1:] if outputs[(backends[0], kind)] != outputs[(other, kind)]]
+    if mismatches:
+        print(f"WARNING: backends disagree on {sorted(set(mismatches))}", file=sys.stderr)
+    return stages, sorted(set(mismatches))
+
+def bench_first_pass(urls, client):
+    latencies = []
+    original = first_scrapp.scrape_one
+    first_scrapp.scrape_one = timed(original, latencies)
+    try:
+        client.peak_in_flight = 0
+        calls, started = client.calls, time.perf_counter()
+        rows = asyncio.run(first_scrapp.scrape_all(urls))
+        elapsed = time.perf_counter() - started
+    finally:
+        first_scrapp.scrape_one = original
+    return rows, report("scrape_all", len(urls), elapsed, latencies,
+                        requests=client.calls - calls, peak_in_flight=client.peak_in_flight, statuses=statuses(rows))
+
+def bench_retry(urls, client):
+    latencies = []
+    original = second_scrapp.scrape_attempt
+    second_scrapp.scrape_attempt = timed(original, latencies)
+    try:
+        client.peak_in_flight = 0
+        calls, started = client.calls, time.perf_counter()
+        rows = asyncio.run(second_scrapp.scrape_all_failed(urls))
+        elapsed = time.perf_counter() - started
+    finally:
+        second_scrapp.scrape_attempt = original
+    return rows, report("scrape_all_failed", len(urls), elapsed, latencies,
+                        requests=client.calls - calls, peak_in_flight=client.peak_in_flight, statuses=statuses(rows))
+
+def bench_merge(rows):
+    started = time.perf_counter()
+    merged = list(json_merge.ScrapReducer().extend(rows).rows())
+    return merged, report("merge", len(rows), time.perf_counter() - started)
+
+def bench_load(rows):
+    started = time.perf_counter()
+    db_manager.load_scrap(rows)
+    return report("load_scrap", len(rows), time.perf_counter() - started)
+
+def bench_pipeline(urls, client):
+    latencies = []
+    originals = pipeline_scrapping.scrape_one, pipeline_scrapping.retry_ladder
+    pipeline_scrapping.scrape_one = timed(originals[0], latencies)
+    pipeline_scrapping.retry_ladder = timed(originals[1], latencies)
+    try:
+        client.peak_in_flight = 0
+        calls, started = client.calls, time.perf_counter()
+        stats = asyncio.run(pipeline_scrapping.run_pipeline(urls, governor=governor.make_governor()))
+        elapsed = time.perf_counter() - started
+    finally:
+        pipeline_scrapping.scrape_one, pipeline_scrapping.retry_ladder = originals
+    depths, budget = stats.pop("queue_depth_max", None), stats.pop("budget", None)
+    return report("pipeline", len(urls), elapsed, latencies, requests=client.calls - calls,
+                  peak_in_flight=client.peak_in_flight, statuses=stats, queue_depth_max=depths, budget=budget)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# MAIN
+# ──────────────────────────────────────────────────────────────────────────────
+STAGES = ("parse", "batch", "pipeline")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", type=int, default=200, help="number of fake catalog URLs")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="median fake Scrapfly latency (non rendered)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal spread of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="share of requests failing with a scrape error")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="fake account limit (429 above it)")
+    parser.add_argument("--max-credits", type=float, default=0, help="pipeline credit ceiling (0 = no governor)")
+    parser.add_argument("--pad-kb", type=int, default=0, help="inflate every fixture page by this many KB")
+    parser.add_argument("--parse-rounds", type=int, default=50, help="passes over the corpus in the parse stage")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma separated subset of {STAGES}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="also write the JSON report here")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's INFO logging")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    selected = set(args.stages.split(","))
+    corpus = load_corpus(pad_kb=args.pad_kb)
+    urls = make_urls(args.urls)
+
+    def new_client():
+        return FakeScrapflyClient(
+            corpus, latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+            throttle_rate=args.throttle_rate, max_concurrency=args.max_concurrency, seed=args.seed,
+        )
+
+    result = {"config": vars(args), "db_url": os.environ["DB_URL"], "stages": []}
+    started = time.perf_counter()
+
+    if "parse" in selected:
+        stages, result["parser_mismatches"] = bench_parse(corpus, args.parse_rounds)
+        result["stages"] += stages
+
+    if "batch" in selected:
+        # legacy two-pass flow: first pass -> retry ladder -> merge -> load
+        client = new_client()
+        install_fakes(client)
+        seed_db(urls)
+        first_rows, stage = bench_first_pass(urls, client)
+        result["stages"].append(stage)
+        failed = [row["_url"] for row in first_rows if row["_status"] not in second_scrapp.DONE_STATUSES]
+        retry_rows, stage = bench_retry(failed, client)
+        result["stages"].append(stage)
+        merged, stage = bench_merge(first_rows + retry_rows)
+        result["stages"].append(stage)
+        result["stages"].append(bench_load(merged))
+        result["batch_credits"] = client.credits
+
+    if "pipeline" in selected:
+        client = new_client()
+        install_fakes(client)
+        governor.GOVERNOR_MAX_CREDITS = args.max_credits
+        seed_db(urls)
+        result["stages"].append(bench_pipeline(urls, client))
+        result["pipeline_credits"] = client.credits
+
+    result["total_seconds"] = round(time.perf_counter() - started, 3)
+    result["peak_rss_mb"] = peak_rss_mb()
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return result
+
+if __name__ == "__main__":
+    main()
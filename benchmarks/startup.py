@@ -0,0 +1,89 @@
+"""
+Cold-start budget of the web process: how long until the webhook can answer.
+
+    python -m benchmarks.startup --budget-ms 400 --runs 5
+
+Every run is a fresh interpreter (`python -X importtime`) that imports main and
+answers one request through Flask's test client. Fails (exit 1) when the best
+run is over budget or when the scraping stack got imported at startup.
+"""
+import argparse, json, os, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Top-level packages the web process must not load before a job is dispatched
+HEAVY = ("bs4", "lxml", "scrapfly", "sqlalchemy", "google", "zstandard", "requests")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+status = main.app.test_client().get("/webhooks/start_scrapping/jobs").status_code
+answered = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_response_ms": (answered - started) * 1000,
+    "status": status,
+    "heavy": sorted({m.split(".")[0] for m in sys.modules} & set(HEAVY)),
+}))
+"""
+
+# ──────────────────────────────────────────────────────────────────────────────
+# HELPERS
+# ──────────────────────────────────────────────────────────────────────────────
+def importtime(stderr, top=10):
+    """Slowest modules of a `-X importtime` log as [(module, cumulative ms)]."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(cumulative) / 1000))
+    return sorted(modules, key=lambda m: m[1], reverse=True)[:top]
+
+def probe(env):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"HEAVY = {HEAVY!r}\n{PROBE}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["slowest"] = importtime(proc.stderr)
+    return result
+
+# ──────────────────────────────────────────────────────────────────────────────
+# MAIN
+# ──────────────────────────────────────────────────────────────────────────────
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=400.0, help="max time from interpreter start to first response")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to start (the best one is judged)")
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args(argv)
+
+    # the probe must measure a cold boot, not the background warm-up
+    env = {**os.environ, "WARMUP_ON_START": "0"}
+    runs = [probe(env) for _ in range(max(1, args.runs))]
+    best = min(runs, key=lambda r: r["first_response_ms"])
+    heavy = sorted({m for r in runs for m in r["heavy"]})
+    result = {
+        "budget_ms": args.budget_ms,
+        "first_response_ms": [round(r["first_response_ms"], 1) for r in runs],
+        "import_ms": [round(r["import_ms"], 1) for r in runs],
+        "best_ms": round(best["first_response_ms"], 1),
+        "heavy_imports": heavy,
+        "slowest_imports": [(name, round(ms, 1)) for name, ms in best["slowest"]],
+        "ok": best["first_response_ms"] <= args.budget_ms and not heavy,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if heavy:
+        print(f"FAIL: scraping stack imported at startup: {heavy}", file=sys.stderr)
+    elif not result["ok"]:
+        print(f"FAIL: first response after {result['best_ms']}ms (budget {args.budget_ms}ms)", file=sys.stderr)
+    return 0 if result["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
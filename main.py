@@ -1,11 +1,29 @@
-from flask import Flask
-from app.services.webhook import scrapping_event 
+from flask import Flask, Response, jsonify, request
+from app.services.webhook import scrapping_event
+from app.services import metrics, warmup
+from app.settings.config import METRICS_SECRET, WARMUP_ON_START
 
 def create_app():
     app = Flask(__name__)
     app.register_blueprint(scrapping_event)
+
+    @app.route("/metrics", methods=["GET"])
+    def prometheus_metrics():
+        """Prometheus text exposition of the scraping metrics."""
+        if METRICS_SECRET and METRICS_SECRET != request.args.get("secret"):
+            return Response(status=401)
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    @app.route("/warmup", methods=["GET"])
+    def warm_up():
+        """Load the scraping stack now (startup probe / scheduler ping before a run)."""
+        state = warmup.warm_up(db=False)
+        return jsonify(state), 200 if state["ready"] else 503
+
+    if WARMUP_ON_START:
+        warmup.start_warm_up()
     return app
 
 app = create_app()
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080, debug=True, use_reloader=True)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=8080, debug=True, use_reloader=True)
@@ -0,0 +1,64 @@
+"""
+Embedded-JSON path of the extractor: JSON-LD + preloaded state.
+"""
+import json, os
+
+from app.services import extractor
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "fixtures")
+
+def _page(state=None, ld=None):
+    html = ""
+    if state is not None:
+        html += f'<script id="__PRELOADED_STATE__" type="application/json">{json.dumps(state)}</script>'
+    if ld is not None:
+        html += f'<script type="application/ld+json">{json.dumps(ld)}</script>'
+    return html
+
+BUY_BOX = {
+    "header": {"title": "Taladro"},
+    "seller": {"seller_info": {"title": "ACME"}},
+    "price": {"price": {"value": 104999.9}},
+}
+
+def test_state_buy_box_alone_is_enough():
+    state = {"pageState": {"initialState": {"id": "MLA18500863", "components": BUY_BOX}}}
+    assert extractor.extract_json_fields(_page(state)) == {"title": "Taladro", "competitor": "ACME", "price": "104.999"}
+
+def test_state_ignores_recommendations_ahead_of_the_components():
+    state = {"pageState": {
+        "recommendations": {"carousel": [{"seller_info": {"title": "OTRO"}, "price": {"value": 5}}]},
+        "initialState": {"id": "MLA18500863", "components": BUY_BOX},
+    }}
+    found = extractor.extract_json_fields(_page(state))
+    assert (found["competitor"], found["price"]) == ("ACME", "104.999")
+
+def test_aggregate_offer_reads_the_first_offer():
+    ld = {"@type": "Product", "name": "Taladro", "offers": {
+        "@type": "AggregateOffer", "lowPrice": 98500, "offers": [
+            {"@type": "Offer", "price": 104999.9, "seller": {"name": "ACME"}},
+            {"@type": "Offer", "price": 98500, "seller": {"name": "OTRO"}},
+        ],
+    }}
+    found = extractor.extract_json_fields(_page(ld=ld))
+    assert (found["competitor"], found["price"]) == ("ACME", "104.999")
+
+def test_aggregate_offer_without_offers_uses_low_price():
+    ld = {"@type": "Product", "name": "Taladro", "offers": {"@type": "AggregateOffer", "lowPrice": 98500}}
+    assert extractor.extract_json_fields(_page(ld=ld))["price"] == "98.500"
+
+def test_json_and_dom_paths_store_the_same_row():
+    for name in ("normal_json", "catalog_offers"):
+        with open(os.path.join(FIXTURES_DIR, f"{name}.html"), encoding="utf-8") as f:
+            html = f.read()
+        dom = extractor.extract_fields(html, mode="dom")
+        js = extractor.extract_fields(html, mode="json")
+        assert js["_source"] == "json"
+        for field in list(extractor.EMPTY_FIELDS) + ["_status"]:
+            assert js[field] == dom[field], f"{name}: {field}"
+
+def test_out_of_stock_json_is_not_discarded():
+    ld = {"@type": "Product", "name": "Taladro", "offers": {
+        "@type": "Offer", "price": 1000, "availability": "https://schema.org/OutOfStock",
+    }}
+    assert extractor.extract_fields(_page(ld=ld), mode="json")["_status"] == "successed"
@@ -0,0 +1,60 @@
+"""
+The lxml fast path must extract exactly what the BeautifulSoup reference does,
+field by field, on the benchmark fixtures and on markup edge cases.
+"""
+import glob, os
+
+import pytest
+
+from app.services import extractor
+
+pytest.importorskip("lxml")
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "benchmarks", "fixtures", "*.html")))
+FIELDS = list(extractor.EMPTY_FIELDS) + ["_status"]
+
+PRICE = '<div class="ui-pdp-price__second-line"><span class="andes-money-amount__fraction">{}</span></div>'
+EDGE_CASES = {
+    "script_in_title": '<h1 class="ui-pdp-title">Hi<script>var a=1</script></h1>',
+    "style_in_title": '<h1 class="ui-pdp-title"><style>h1{color:red}</style>Taladro</h1>',
+    "template_in_title": '<h1 class="ui-pdp-title">A<template>T</template>B</h1>',
+    "comment_in_title": '<h1 class="ui-pdp-title">Tala<!-- x -->dro</h1>',
+    "nested_title": '<h1 class="ui-pdp-title"> <b>Taladro</b> <i>20v</i> </h1>',
+    "entities": '<h1 class="ui-pdp-title">Black&amp;Decker&nbsp;Ld120</h1>' + PRICE.format("1.000"),
+    "script_in_price": PRICE.format("104.999<script>track()</script>"),
+    "script_in_seller": '<h2 class="ui-seller-data-header__title">Vendido por <script>x</script>ACME</h2>',
+    "installments_with_style": '<div class="ui-pdp-price__subtitles"><style>p{}</style><p>6 cuotas</p></div>',
+    "extra_class_tokens": '<h1 class="x ui-pdp-title  y">Taladro</h1>',
+    "class_prefix_only": '<h1 class="ui-pdp-title-container">Taladro</h1>',
+    "price_outside_box": '<h1 class="ui-pdp-title">T</h1><span class="andes-money-amount__fraction">9</span>',
+    "image_without_src": '<h1 class="ui-pdp-title">T</h1><img class="ui-pdp-image">',
+    "discard_with_script": (
+        '<p class="ui-pdp-shipping-message__text">Este producto no está disponible.'
+        '<script>x</script> Elige otra variante.</p>'
+    ),
+    "empty": "",
+    "whitespace": "   \n ",
+}
+
+def _documents():
+    for path in FIXTURES:
+        with open(path, encoding="utf-8") as f:
+            yield os.path.basename(path), f.read()
+    yield from EDGE_CASES.items()
+
+DOCUMENTS = dict(_documents())
+
+@pytest.mark.parametrize("name", list(DOCUMENTS))
+def test_backends_agree(name):
+    html = DOCUMENTS[name]
+    reference = extractor.extract_fields(html, backend="bs4", mode="dom")
+    fast = extractor.extract_fields(html, backend="lxml", mode="dom")
+    for field in FIELDS:
+        assert fast[field] == reference[field], f"{name}: {field}"
+
+def test_fixtures_found():
+    assert FIXTURES
+
+def test_script_text_is_not_part_of_the_title():
+    html = EDGE_CASES["script_in_title"]
+    assert extractor.extract_fields(html, backend="lxml", mode="dom")["title"] == "Hi"
@@ -0,0 +1,24 @@
+"""
+Cold start of the web process: the webhook answers before the scraping stack
+is imported (benchmarks/startup.py measures the same thing with timings).
+"""
+import json, os, subprocess, sys
+
+from benchmarks import startup
+
+def test_no_heavy_import_before_the_first_response():
+    env = {**os.environ, "WARMUP_ON_START": "0"}
+    probe = f"HEAVY = {startup.HEAVY!r}\n{startup.PROBE}"
+    proc = subprocess.run(
+        [sys.executable, "-c", probe], cwd=startup.ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    assert result["status"] == 200
+    assert result["heavy"] == []
+
+def test_startup_budget():
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--runs", "3"],
+        cwd=startup.ROOT, capture_output=True, text=True,
+    )
+    assert proc.returncode == 0, proc.stderr